@@ -15,4 +15,11 @@ then
         > /gor/goreplay.log &
 fi
 
+# UWSGI_ASYNC=1 starts the gevent instance that serves /mobile/entity and /mobile/calendar (see server_async.py)
+if [[ "$UWSGI_ASYNC" == "1" ]]
+then
+    export DD_GEVENT_PATCH_ALL=true
+    exec /var/app/.venv/bin/ddtrace-run uwsgi --ini "/var/app/deploy/uwsgi-async.ini"
+fi
+
 exec /var/app/.venv/bin/ddtrace-run uwsgi --ini "/var/app/deploy/uwsgi.ini"
\ No newline at end of file
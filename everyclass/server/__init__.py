@@ -1,6 +1,8 @@
 import gc
 import logging
 import os
+import threading
+import time
 
 from datadog import DogStatsd
 from ddtrace import tracer
@@ -13,7 +15,8 @@ from raven.handlers.logging import SentryHandler
 
 from everyclass.server.utils import web_consts
 from everyclass.server.utils.common_helpers import plugin_available
-from everyclass.server.utils.session import EncryptedSessionInterface
+from everyclass.server.utils.session import EncryptedSessionInterface, ServerSideSessionInterface, RedisSessionStore, \
+    LocalSessionStore
 
 logger = logging.getLogger(__name__)
 sentry = Sentry()
@@ -62,11 +65,10 @@ try:
 
     @uwsgidecorators.postfork
     def init_db():
-        """初始化数据库连接"""
-        from everyclass.server.utils.db.postgres import init_pool as init_pg
+        """重新初始化数据库连接池"""
+        from everyclass.server.utils.db.pool import init_pools
 
-        # init_mongo(__app)
-        init_pg()
+        init_pools()
 
 
     @uwsgidecorators.postfork
@@ -78,15 +80,36 @@ try:
         cron_update_remote_manifest()
 
 
+    @uwsgidecorators.postfork
+    def warm_up():
+        """预热连接池和教室列表，需要在初始化数据库连接、获取远程 manifest 之后执行"""
+        from everyclass.server.utils.warmup import warm_up_worker
+        warm_up_worker(__app)
+
+
     @uwsgidecorators.cron(0, -1, -1, -1, -1)
     def daily_update_data_time(signum):
         """每天凌晨更新数据最后更新时间"""
         cron_update_remote_manifest()
 
+
+    @uwsgidecorators.cron(-10, -1, -1, -1, -1)
+    def rebuild_autocomplete_index(signum):
+        """每 10 分钟由一个 worker 重建自动补全索引文件，其他 worker 检测到文件更新后重新打开"""
+        cron_rebuild_autocomplete_index()
+
 except ModuleNotFoundError:
     pass
 
 
+def cron_rebuild_autocomplete_index():
+    """重建多人日程搜索的自动补全索引"""
+    from everyclass.server.entity import service as entity_service
+
+    count = entity_service.rebuild_autocomplete_index(__app.config['DATA_LAST_UPDATE_TIME'])
+    logger.info(f"Autocomplete index rebuilt with {count} people")
+
+
 def cron_update_remote_manifest():
     """更新数据最后更新时间"""
     from everyclass.rpc.http import HttpRpc
@@ -99,11 +122,31 @@ def cron_update_remote_manifest():
     __app.config['ANDROID_CLIENT_URL'] = android_manifest['releases'][android_ver]['url']
 
     # 更新数据最后更新时间
+    __app.config['DATA_LAST_UPDATE_TIME'] = fetch_data_version(__app)
+
+    # 数据版本变化后在后台刷新教学班上冗余的老师信息，不阻塞 worker 启动。版本没有变化时不启动线程
+    if __app.config['FEATURE_GATING'].get('course', False):
+        from everyclass.server.course import service as course_service
+
+        data_version = __app.config['DATA_LAST_UPDATE_TIME']
+        if not course_service.teachers_display_synced(data_version):
+            def sync():
+                # 查询老师信息需要 app 上下文（数据版本、上游配置、缓存），否则每个老师都会发起一次不走缓存的搜索
+                with __app.app_context():
+                    course_service.sync_teachers_display(data_version)
+
+            threading.Thread(target=sync, daemon=True).start()
+
+
+def fetch_data_version(app) -> str:
+    """从 entity 服务获得当前的数据版本（数据最后更新时间）"""
+    from everyclass.rpc.http import HttpRpc
+
     _api_server_status = HttpRpc.call(method="GET",
-                                      url=__app.config['ENTITY_BASE_URL'] + '/info/service',
+                                      url=app.config['ENTITY_BASE_URL'] + '/info/service',
                                       retry=True,
-                                      headers={'X-Auth-Token': __app.config['ENTITY_TOKEN']})
-    __app.config['DATA_LAST_UPDATE_TIME'] = _api_server_status["data"]["data_time"]
+                                      headers={'X-Auth-Token': app.config['ENTITY_TOKEN']})
+    return _api_server_status["data"]["data_time"]
 
 
 def create_app() -> Flask:
@@ -124,6 +167,11 @@ def create_app() -> Flask:
     _config = get_config()
     app.config.from_object(_config)  # noqa: T484
 
+    # 在加载模板时压缩模板，代替对每个响应的运行时压缩。需要在 jinja_env 被创建前设置
+    if app.config['TEMPLATE_MINIFY']:
+        from everyclass.server.utils.template_minify import MinifiedFileSystemLoader
+        app.jinja_loader = MinifiedFileSystemLoader(os.path.join(app.root_path, app.template_folder))
+
     """
     每课统一日志机制
 
@@ -158,8 +206,21 @@ def create_app() -> Flask:
     # moment
     Moment(app)
 
-    # encrypted session
-    app.session_interface = EncryptedSessionInterface()
+    # 维护模式状态在 fork 前读取一次，之后由信号更新（见 utils/maintenance.py）
+    from everyclass.server.utils import maintenance
+    maintenance.reload()
+
+    # session
+    if app.config['SESSION_TYPE'] == 'redis':
+        from everyclass.server.utils.db.redis import redis, redis_prefix
+        app.session_interface = ServerSideSessionInterface(RedisSessionStore(redis, f"{redis_prefix}:session"),
+                                                           app.config['SECRET_KEY'], app.config['SESSION_SERIALIZER'])
+    elif app.config['SESSION_TYPE'] == 'local':
+        app.session_interface = ServerSideSessionInterface(LocalSessionStore(), app.config['SECRET_KEY'],
+                                                           app.config['SESSION_SERIALIZER'])
+    else:
+        app.session_interface = EncryptedSessionInterface(app.config['SESSION_CRYPTO_KEY'],
+                                                          app.config['SESSION_SERIALIZER'])
 
     # 导入并注册 blueprints
     from everyclass.server.calendar.views import calendar_bp
@@ -187,20 +248,61 @@ def create_app() -> Flask:
     if 'AUTH_BASE_URL' in app.config:
         Auth.set_base_url(app.config['AUTH_BASE_URL'])
 
+    # 请求阶段耗时。最先注册，使 add_server_timing 在其他 after_request 钩子（如 HTML 压缩）之后执行
+    from everyclass.server.utils import timing
+    timing.enabled = app.config['PHASE_TIMING_ENABLED']
+    if timing.enabled:
+        from flask import before_render_template, template_rendered
+
+        @app.before_request
+        def start_timing():
+            g.request_start = time.perf_counter()
+
+        @before_render_template.connect_via(app)
+        def start_render(sender, template, context, **extra):
+            g.setdefault('render_starts', []).append(time.perf_counter())
+
+        @template_rendered.connect_via(app)
+        def finish_render(sender, template, context, **extra):
+            timing.record(timing.PHASE_RENDER, time.perf_counter() - g.render_starts.pop())
+
+        if not is_production():
+            @app.after_request
+            def add_server_timing(response):
+                """在响应中加入 Server-Timing 头，可以在浏览器开发者工具中查看各阶段耗时"""
+                if 'request_start' in g:
+                    response.headers['Server-Timing'] = timing.server_timing_header(time.perf_counter() - g.request_start)
+                return response
+
+        @app.teardown_request
+        def report_timing(exception=None):
+            """上报各阶段耗时，此时 session 已经保存"""
+            timing.report(request.endpoint or 'unknown')
+
     @app.before_request
     def set_user_id():
-        """在请求之前设置 session uid，方便 APM 标识用户"""
+        """在请求之前把 session uid 标记到 APM 上，方便标识用户。新用户的 uid 在 session 需要保存时才分配（见 assign_user_id）"""
         from everyclass.server.utils.web_consts import SESSION_CURRENT_USER, SESSION_USER_SEQ
-        from everyclass.server.user import service as user_service
 
-        if not session.get('user_id', None) and request.endpoint not in ("main.health_check", "static"):
-            logger.info(f"Give a new user ID for new user. endpoint: {request.endpoint}")
-            session['user_id'] = user_service.get_user_id()
-        if session.get('user_id', None):
+        if session.get(SESSION_USER_SEQ, None):
             tracer.current_root_span().set_tag("user_id", session[SESSION_USER_SEQ])  # 唯一用户 ID
         if session.get(SESSION_CURRENT_USER, None):
             tracer.current_root_span().set_tag("username", session[SESSION_CURRENT_USER].identifier)  # 学号或教工号
 
+    @app.after_request
+    def assign_user_id(response):
+        """
+        session 被修改、需要保存时才为新用户分配 uid。没有 cookie 的爬虫和只浏览页面的新访客不会写 session，也就不会分配 uid
+        """
+        from everyclass.server.utils.web_consts import SESSION_USER_SEQ
+        from everyclass.server.user import service as user_service
+
+        if session.modified and session and not session.get(SESSION_USER_SEQ, None):
+            logger.info(f"Give a new user ID for new user. endpoint: {request.endpoint}")
+            user_service.get_user_id()
+            tracer.current_root_span().set_tag("user_id", session[SESSION_USER_SEQ])
+        return response
+
     @app.before_request
     def log_request():
         """日志中记录请求"""
@@ -208,16 +310,30 @@ def create_app() -> Flask:
 
     @app.after_request
     def response_minify(response):
-        """用 htmlmin 压缩 HTML，减轻带宽压力"""
+        """用 htmlmin 压缩 HTML，减轻带宽压力。默认关闭，模板已经在加载时被压缩（见 TEMPLATE_MINIFY）"""
         if app.config['HTML_MINIFY'] and response.content_type == u'text/html; charset=utf-8':
-            response.set_data(minify(response.get_data(as_text=True)))
+            with timing.phase(timing.PHASE_MINIFY):
+                response.set_data(minify(response.get_data(as_text=True)))
         return response
 
-    from everyclass.server.utils.db.postgres import db_session
+    from everyclass.server.utils.db.postgres import db_session, replica_session
 
     @app.teardown_appcontext
     def shutdown_db_session(exception=None):
         db_session.remove()
+        replica_session.remove()
+
+    @app.cli.command('build-timetable-snapshot')
+    def build_timetable_snapshot():
+        """为当前学期构建课表快照文件（TIMETABLE_SNAPSHOT_FILE），在 entity 数据更新后运行"""
+        import datetime
+        from everyclass.server.entity import service as entity_service
+        from everyclass.server.entity.domain import get_semester_date
+
+        app.config['DATA_LAST_UPDATE_TIME'] = fetch_data_version(app)
+        semester = get_semester_date(datetime.date.today())[0]
+        count = entity_service.build_timetable_snapshot(app.config['DATA_LAST_UPDATE_TIME'], semester)
+        logger.info(f"Timetable snapshot of {semester} built with {count} entries")
 
     @app.template_filter('versioned')
     def version_filter(filename):
@@ -242,7 +358,8 @@ def create_app() -> Flask:
     def inject_consts():
         """允许在模板中使用常量模块，以便使用session key等常量而不用在模板中硬编码"""
         return dict(consts=web_consts,
-                    api_base_url=app.config['MOBILE_API_BASE_URL'])
+                    api_base_url=app.config['MOBILE_API_BASE_URL'],
+                    entity_data_stale=g.get('entity_data_stale', False))
 
     @app.errorhandler(404)
     def page_not_found(error):
@@ -5,7 +5,7 @@ https://tools.ietf.org/html/rfc2445
 import hashlib
 import os
 from datetime import datetime, timedelta
-from typing import Dict, List, Tuple
+from typing import Dict, Iterator, List, Tuple
 
 import pytz
 from ddtrace import tracer
@@ -32,7 +32,7 @@ def generate(name: str, cards: Dict[Tuple[int, int], List[Dict]], semester: Seme
     生成 ics 文件并保存到目录
 
     :param name: 姓名
-    :param cards: 参与的课程
+    :param cards: 参与的课程，key 为 (星期, 大节序号)，上课周次为位掩码 weeks_mask
     :param semester: 当前导出的学期
     :param filename: 输出的文件名称，带后缀
     :return: None
@@ -62,7 +62,7 @@ def generate(name: str, cards: Dict[Tuple[int, int], List[Dict]], semester: Seme
             for day in range(1, 8):
                 if (day, time) in cards:
                     for card in cards[(day, time)]:
-                        for week in card['week']:
+                        for week in _weeks_of(card['weeks_mask']):
                             dtstart = _get_datetime(week, day, get_time(time)[0], semester)
                             dtend = _get_datetime(week, day, get_time(time)[1], semester)
 
@@ -84,6 +84,14 @@ def generate(name: str, cards: Dict[Tuple[int, int], List[Dict]], semester: Seme
             f.write(data)
 
 
+def _weeks_of(weeks_mask: int) -> Iterator[int]:
+    """遍历周次位掩码（第 n 周对应第 n 位，见 entity/model/card.py）中的周次，只访问被置位的位"""
+    while weeks_mask:
+        lowest = weeks_mask & -weeks_mask
+        yield lowest.bit_length() - 1
+        weeks_mask ^= lowest
+
+
 def _get_datetime(week: int, day: int, time: Tuple[int, int], semester: Tuple[int, int, int]) -> datetime:
     """
     根据学期、周次、时间，生成 `datetime` 类型的时间
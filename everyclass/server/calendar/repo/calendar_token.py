@@ -4,8 +4,21 @@ import uuid
 from typing import overload, Union, Dict, Optional
 
 from everyclass.server.utils.db import pg_conn_context
+from everyclass.server.utils.db.prepared import PreparedStatement
 from everyclass.server.utils.db.redis import redis, redis_prefix
 
+_update_last_used_time = PreparedStatement("calendar_token_update_last_used_time", """
+        UPDATE calendar_tokens SET last_used_time = %s WHERE token = %s
+        """)
+_select_by_token = PreparedStatement("calendar_token_select_by_token", """
+            SELECT type, identifier, semester, token, create_time, last_used_time FROM calendar_tokens
+                WHERE token=%s
+            """)
+_select_by_identifier = PreparedStatement("calendar_token_select_by_identifier", """
+            SELECT type, identifier, semester, token, create_time, last_used_time FROM calendar_tokens
+                WHERE type=%s AND identifier=%s AND semester=%s
+            """)
+
 
 def insert_calendar_token(resource_type: str, semester: str, identifier: str) -> str:
     """
@@ -31,10 +44,7 @@ def insert_calendar_token(resource_type: str, semester: str, identifier: str) ->
 def update_last_used_time(token: str):
     """更新token最后使用时间"""
     with pg_conn_context() as conn, conn.cursor() as cursor:
-        insert_query = """
-        UPDATE calendar_tokens SET last_used_time = %s WHERE token = %s;
-        """
-        cursor.execute(insert_query, (datetime.datetime.now(), uuid.UUID(token)))
+        _update_last_used_time.execute(cursor, (datetime.datetime.now(), uuid.UUID(token)))
         conn.commit()
 
 
@@ -72,21 +82,13 @@ def find_calendar_token(sid: str, semester: str) -> Union[Dict, None]:
 
 def find_calendar_token(tid=None, sid=None, semester=None, token=None):
     """通过 token 或者 sid/tid + 学期获得 token 文档"""
-    with pg_conn_context() as conn, conn.cursor() as cursor:
+    with pg_conn_context(read_only=True) as conn, conn.cursor() as cursor:
         if token:
-            select_query = """
-            SELECT type, identifier, semester, token, create_time, last_used_time FROM calendar_tokens
-                WHERE token=%s
-            """
-            cursor.execute(select_query, (uuid.UUID(token),))
+            _select_by_token.execute(cursor, (uuid.UUID(token),))
             result = cursor.fetchall()
             return _parse(result[0]) if result else None
         elif (tid or sid) and semester:
-            select_query = """
-            SELECT type, identifier, semester, token, create_time, last_used_time FROM calendar_tokens
-                WHERE type=%s AND identifier=%s AND semester=%s;
-            """
-            cursor.execute(select_query, ("teacher" if tid else "student", tid, semester))
+            _select_by_identifier.execute(cursor, ("teacher" if tid else "student", tid, semester))
             result = cursor.fetchall()
             return _parse(result[0]) if result else None
         else:
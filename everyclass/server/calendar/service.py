@@ -5,7 +5,6 @@ from typing import Optional
 
 from ddtrace import tracer
 
-from everyclass.common.time import lesson_string_to_tuple
 from everyclass.rpc.entity import teacher_list_to_name_str
 from everyclass.server import logger
 from everyclass.server.calendar.domain import ics_generator
@@ -80,12 +79,12 @@ def generate_ics_file(type_: str, identifier: str, semester: str) -> str:
 
         cards: Dict[Tuple[int, int], List[Dict]] = defaultdict(list)
         for card in rpc_result.cards:
-            cards[lesson_string_to_tuple(card.lesson)].append(dict(name=card.name,
-                                                                   teacher=teacher_list_to_name_str(card.teachers),
-                                                                   week=card.weeks,
-                                                                   week_string=card.week_string,
-                                                                   classroom=card.room,
-                                                                   cid=card.card_id_encoded))
+            cards[(card.day, card.session)].append(dict(name=card.name,
+                                                        teacher=teacher_list_to_name_str(card.teachers),
+                                                        weeks_mask=card.weeks_mask,
+                                                        week_string=card.week_string,
+                                                        classroom=card.room,
+                                                        cid=card.card_id_encoded))
 
     ics_generator.generate(name=rpc_result.name,
                            cards=cards,
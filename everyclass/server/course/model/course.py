@@ -1,8 +1,12 @@
+import json
+
 import sqlalchemy as sa
 from sqlalchemy import Column, String
 from sqlalchemy.orm import relationship
 
 from everyclass.server.utils.db.postgres import Base, db_session
+from everyclass.server.utils.db.redis import redis, redis_prefix
+from everyclass.server.utils.jsonable import to_json
 
 
 class CourseMeta(Base):
@@ -23,26 +27,45 @@ class CourseMeta(Base):
                   '文学与外语', '军事与体育', '音乐与艺术', '中国传统文化', '人际与心理', '政治与政务',
                   '思维与哲学', '学术', '法律', '自然与社会']
 
+    CATEGORIES_CACHE_KEY = f"{redis_prefix}:course_categories"
+    CATEGORY_TOP_N = 3  # 每个类别只取前3门评分最高的课程
+
     @classmethod
     def get_categories(cls):
-        """获得所有类别和对应的课程ID"""
+        """获得所有类别和对应的评分最高的课程
+
+        每个类别的前几名由窗口函数在数据库中一次查出，老师信息读取 KlassMeta 上的冗余字段。结果缓存在 Redis 中，评分只会在
+        `KlassReview.sync_to_class_meta` 时变化，所以缓存在同步时清除，不设置过期时间。
+        """
         from .klass import KlassMeta
 
-        results = db_session.query(KlassMeta).all()
+        cached = redis.get(cls.CATEGORIES_CACHE_KEY)
+        if cached:
+            return json.loads(cached.decode())
 
-        categories = {}
+        rank = sa.func.row_number().over(partition_by=cls.main_category,
+                                         order_by=KlassMeta.score.desc()).label('rank')
+        ranked = db_session.query(KlassMeta.klass_id, cls.main_category, rank). \
+            join(cls, KlassMeta.course_id == cls.course_id).subquery()
+        top_classes = db_session.query(KlassMeta). \
+            join(ranked, KlassMeta.klass_id == ranked.c.klass_id). \
+            filter(ranked.c.rank <= cls.CATEGORY_TOP_N). \
+            order_by(ranked.c.main_category, ranked.c.rank).all()
+        total_classes = db_session.query(sa.func.count(KlassMeta.klass_id)).scalar()
 
-        for klass in results:
-            if klass.course.main_category not in categories:
-                categories[klass.course.main_category] = [klass]
-            else:
-                categories[klass.course.main_category].append(klass)
+        categories = {}
+        for klass in top_classes:
+            categories.setdefault(klass.course.main_category, []).append(klass.to_dict())
 
-        for _, classes in categories.items():
-            classes.sort(key=lambda x: x.score, reverse=True)
+        result = {'categories': [{'name': k, 'classes': v} for k, v in categories.items()],
+                  'total_classes': total_classes}
+        redis.set(cls.CATEGORIES_CACHE_KEY, to_json(result))
+        return result
 
-        return {'categories': [{'name': k, 'classes': v[:3]} for k, v in categories.items()],
-                'total_classes': len(results)}  # 每个类别只取前3门评分最高的课程
+    @classmethod
+    def clear_categories_cache(cls) -> None:
+        """评分或教学班变化后清除类别缓存"""
+        redis.delete(cls.CATEGORIES_CACHE_KEY)
 
     @classmethod
     def import_demo_content(cls):
@@ -319,3 +342,4 @@ h3-01	戏剧台词鉴赏	普通课	本科生院(行政)
                 course = CourseMeta(course_id=splitted[0], name=splitted[1], main_category=category_name, unit=unit)
                 db_session.add(course)
         db_session.commit()
+        cls.clear_categories_cache()
@@ -1,12 +1,13 @@
 import json
 import os
+from typing import Dict, List
 
 import sqlalchemy as sa
 from sqlalchemy import Column, String, Integer, Float
 from sqlalchemy.dialects import postgresql as pg
 from sqlalchemy.orm import relationship
 
-from everyclass.server.utils.db.postgres import Base, db_session
+from everyclass.server.utils.db.postgres import Base, db_session, read_session
 from everyclass.server.utils.jsonable import JSONSerializable
 
 
@@ -18,6 +19,9 @@ class KlassMeta(Base, JSONSerializable):
     course = relationship("CourseMeta", back_populates="classes", lazy=False)
     semester = Column(String(15), nullable=False)  # 所在学期
     teachers = Column(pg.ARRAY(String))  # 任课教师名单
+    # 任课教师展示信息的冗余，顺序与 teachers 一致，形如 [{"teacher_id": "", "name": "", "title": ""}]。
+    # 导入时写入，entity 数据版本变化后由 sync_teachers_display 刷新，序列化时不再需要逐个 RPC 查询老师信息
+    teachers_display = Column(pg.JSONB, nullable=True)
 
     # 评分的缓存，来源是klass_review，每日cron刷新
     score = Column("score", Float, nullable=False)
@@ -30,18 +34,24 @@ class KlassMeta(Base, JSONSerializable):
     reviews = relationship("KlassReview", back_populates="klass", lazy=True)
 
     def __json_encode__(self):
-        from everyclass.server.entity.service import get_people_info
+        return self.to_dict()
 
+    def to_dict(self) -> Dict:
         return {'class_id': self.klass_id,
                 'name': self.course.name,
-                'teachers': [{'name': t.name, 'title': t.title} for t in [get_people_info(teacher_id)[1] for teacher_id in self.teachers]],
-                # todo 速度太慢了，entity要出批量查询接口
+                'teachers': [{'name': t['name'], 'title': t['title']} for t in (self.teachers_display or [])],
                 'score': round(self.score, 1),
                 'review_quote': self.review_quote}
 
+    @staticmethod
+    def make_teachers_display(teacher_ids: List[str], people_info: Dict) -> List[Dict]:
+        """根据教工号到老师信息的映射生成 teachers_display 字段，查不到信息的老师会被跳过"""
+        return [{'teacher_id': teacher_id, 'name': people_info[teacher_id].name, 'title': people_info[teacher_id].title}
+                for teacher_id in teacher_ids if teacher_id in people_info]
+
     @classmethod
     def get_all(cls):
-        return db_session.query(cls).all()
+        return read_session().query(cls).all()
 
     @classmethod
     def import_demo_content(cls):
@@ -52,7 +62,26 @@ class KlassMeta(Base, JSONSerializable):
 
                 teachers = json.loads(teachers)
                 teacher_list = [t['code'] for t in teachers]
+                teachers_display = [{'teacher_id': t['code'], 'name': t['name'], 'title': t['title']} for t in teachers]
 
-                k = KlassMeta(course_id=course_id, semester='2019-2020-2', score=-1, teachers=teacher_list)
+                k = KlassMeta(course_id=course_id, semester='2019-2020-2', score=-1, teachers=teacher_list,
+                              teachers_display=teachers_display)
                 db_session.add(k)
             db_session.commit()
+
+        from .course import CourseMeta
+        CourseMeta.clear_categories_cache()
+
+    @classmethod
+    def sync_teachers_display(cls) -> None:
+        """从 entity 服务重新获取所有教学班的老师信息，刷新 teachers_display 字段"""
+        from everyclass.server.entity.service import get_people_info_batch
+        from .course import CourseMeta
+
+        all_classes = db_session.query(cls).all()  # 需要修改查到的对象，不能用 get_all 从只读副本读取
+        people_info = get_people_info_batch(teacher_id for klass in all_classes for teacher_id in klass.teachers)
+        for klass in all_classes:
+            klass.teachers_display = cls.make_teachers_display(klass.teachers, people_info)
+        db_session.commit()
+
+        CourseMeta.clear_categories_cache()
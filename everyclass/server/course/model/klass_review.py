@@ -65,7 +65,7 @@ class KlassReview(Base):
     @classmethod
     def sync_to_class_meta(cls):
         """同步class评价到class元信息表"""
-        from everyclass.server.course.model import KlassMeta
+        from everyclass.server.course.model import KlassMeta, CourseMeta
 
         all_classes = db_session.query(KlassMeta).all()
         for klass in all_classes:
@@ -102,6 +102,8 @@ class KlassReview(Base):
             klass.gender_rate = round(gender_rate, 2)
 
             db_session.commit()
+
+        CourseMeta.clear_categories_cache()
         return
 
     @classmethod
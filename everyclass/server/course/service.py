@@ -1,4 +1,13 @@
-from everyclass.server.course.model import Questionnaire, AnswerSheet, CourseMeta
+import uuid
+
+from everyclass.server import logger
+from everyclass.server.course.model import Questionnaire, AnswerSheet, CourseMeta, KlassMeta
+from everyclass.server.utils.db.postgres import db_session
+from everyclass.server.utils.db.redis import redis, redis_prefix
+
+_TEACHERS_DISPLAY_VERSION_KEY = f"{redis_prefix}:klass_teachers_display_synced_version"
+_TEACHERS_DISPLAY_LOCK_KEY = f"{redis_prefix}:klass_teachers_display_lock"
+_TEACHERS_DISPLAY_LOCK_SECONDS = 60 * 10
 
 
 def get_class_categories():
@@ -14,3 +23,30 @@ def get_advice_questions():
 
 def get_advice_result(answer_sheet: AnswerSheet):
     return answer_sheet.get_advice()
+
+
+def teachers_display_synced(data_version: str) -> bool:
+    """教学班上冗余的老师信息是否已经按 data_version 同步过"""
+    synced_version = redis.get(_TEACHERS_DISPLAY_VERSION_KEY)
+    return synced_version is not None and synced_version.decode() == data_version
+
+
+def sync_teachers_display(data_version: str) -> None:
+    """entity 数据版本变化时刷新教学班上冗余的老师信息
+
+    同步成功后才在 Redis 中记录已同步的版本，失败时不记录，下次数据版本检查时重试。同步期间持有锁，其他 worker 不会重复同步。
+    """
+    if teachers_display_synced(data_version):
+        return
+    token = uuid.uuid4().hex
+    if not redis.set(_TEACHERS_DISPLAY_LOCK_KEY, token, nx=True, ex=_TEACHERS_DISPLAY_LOCK_SECONDS):
+        return
+
+    logger.info(f"entity data version changed to {data_version}, syncing teachers display info of classes")
+    try:
+        KlassMeta.sync_teachers_display()
+        redis.set(_TEACHERS_DISPLAY_VERSION_KEY, data_version)
+    finally:
+        db_session.remove()
+        if redis.get(_TEACHERS_DISPLAY_LOCK_KEY) == token.encode():
+            redis.delete(_TEACHERS_DISPLAY_LOCK_KEY)
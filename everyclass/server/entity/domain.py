@@ -1,8 +1,15 @@
 import datetime
-from typing import Tuple, List
+import functools
+import threading
+import time
+from typing import List, Optional, Tuple
 
-from everyclass.rpc import RpcClientException, RpcServerException, RpcTimeout
+from flask import current_app, g, has_app_context
+
+from everyclass.rpc import RpcClientException, RpcServerException, RpcServerNotAvailable, RpcTimeout
+from everyclass.server.entity.repo import entity_cache
 from everyclass.server.utils import base_exceptions
+from everyclass.server.utils.circuit_breaker import UpstreamUnavailable
 from everyclass.server.utils.config import get_config
 
 
@@ -52,3 +59,73 @@ def replace_exception(func):
             raise base_exceptions.InternalError(repr(e))
 
     return _func
+
+
+def current_data_version() -> Optional[str]:
+    """当前的数据版本，缓存的 key 中需要带上它。不在 Flask 上下文中（如后台线程）时返回 None，不使用缓存"""
+    return current_app.config['DATA_LAST_UPDATE_TIME'] if has_app_context() else None
+
+
+def _refresh_in_background(app, func, name: str, args: tuple, kwargs: dict, params: tuple, data_version: str) -> None:
+    """在后台线程中刷新缓存。上游调用需要读取 app.config，所以刷新在 app 的上下文中进行"""
+    from everyclass.server import logger
+
+    config = get_config()
+
+    def refresh():
+        try:
+            with app.app_context():
+                result = func(*args, **kwargs)
+            entity_cache.set(name, params, data_version, result, config.ENTITY_CACHE_HARD_TTL,
+                             config.ENTITY_CACHE_STALE_IF_ERROR_TTL)
+        except Exception as e:
+            logger.warning(f"Background refresh of {name}{params} failed: {repr(e)}")
+
+    threading.Thread(target=refresh, daemon=True).start()
+
+
+def serve_stale(func):
+    """
+    为 entity 读接口缓存上游的结果（按数据版本和参数缓存在 Redis 中）：
+
+    - 结果获取后 ENTITY_CACHE_SOFT_TTL 秒内：直接返回缓存；
+    - 超过软过期时间、未超过 ENTITY_CACHE_HARD_TTL 秒：返回缓存，同时在后台刷新；
+    - 超过硬过期时间或数据版本变化后：同步请求上游。上游超时、不可用或已熔断时返回最近一次成功的结果（不区分数据版本，保留
+      ENTITY_CACHE_STALE_IF_ERROR_TTL 秒），并把 g.entity_data_stale 置为 True，模板据此提示用户数据可能不是最新的。
+
+    只用于只读、参数可以 str() 后唯一标识的函数。不在 Flask 上下文中时不使用缓存。
+    """
+    name = func.__qualname__
+
+    @functools.wraps(func)
+    def wrapped(*args, **kwargs):
+        data_version = current_data_version()
+        if data_version is None:
+            return func(*args, **kwargs)
+
+        config = get_config()
+        params = args + tuple(sorted(kwargs.items()))
+        cached = entity_cache.get(name, params, data_version)
+        if cached:
+            age = time.time() - cached[0]
+            if age < config.ENTITY_CACHE_SOFT_TTL:
+                return cached[1]
+            if age < config.ENTITY_CACHE_HARD_TTL:
+                if entity_cache.lock_refresh(name, params, data_version, config.ENTITY_CACHE_REFRESH_TIMEOUT):
+                    _refresh_in_background(current_app._get_current_object(), func, name, args, kwargs, params,
+                                           data_version)
+                return cached[1]
+
+        try:
+            result = func(*args, **kwargs)
+        except (RpcServerException, RpcServerNotAvailable, RpcTimeout, UpstreamUnavailable):
+            stale = entity_cache.get_stale(name, params)
+            if not stale:
+                raise
+            g.entity_data_stale = True
+            return stale[1]
+        entity_cache.set(name, params, data_version, result, config.ENTITY_CACHE_HARD_TTL,
+                         config.ENTITY_CACHE_STALE_IF_ERROR_TTL)
+        return result
+
+    return wrapped
@@ -1,4 +1,5 @@
 from .available_rooms import AvailableRooms, UnavailableRoomReport
+from .card import Card
 from .multi_people_schedule import MultiPeopleSchedule, Event, SearchResultItem
 from .rooms import AllRooms
 from .semester import Semester
@@ -0,0 +1,47 @@
+from typing import Iterable, List
+
+from everyclass.common.time import lesson_string_to_tuple
+
+
+class Card:
+    """
+    课表中的一节课。RPC 返回的课程在 entity/service.py 中被转换为这个类型：上课时间预先解析为 (星期, 节次) 两个整数，上课周次保存为
+    整数位掩码（第 n 周对应第 n 位），避免每次渲染都重复解析 lesson 字符串、在 weeks 列表中查找。
+    """
+    __slots__ = ('name', 'course_id', 'teachers', 'room', 'room_id_encoded', 'card_id_encoded', 'week_string', 'lesson',
+                 'day', 'session', 'weeks_mask')
+
+    def __init__(self, name: str, course_id: str, teachers: List, room: str, room_id_encoded: str, card_id_encoded: str,
+                 week_string: str, lesson: str, weeks: Iterable[int]):
+        self.name = name
+        self.course_id = course_id
+        self.teachers = teachers
+        self.room = room
+        self.room_id_encoded = room_id_encoded
+        self.card_id_encoded = card_id_encoded
+        self.week_string = week_string
+        self.lesson = lesson
+        self.day, self.session = lesson_string_to_tuple(lesson)
+        self.weeks_mask = 0
+        for week in weeks:
+            self.weeks_mask |= 1 << week
+
+    def __getstate__(self):
+        return tuple(getattr(self, slot) for slot in self.__slots__)
+
+    def __setstate__(self, state):
+        for slot, value in zip(self.__slots__, state):
+            setattr(self, slot, value)
+
+    @classmethod
+    def from_rpc(cls, card) -> "Card":
+        return cls(card.name, card.course_id, card.teachers, card.room, card.room_id_encoded, card.card_id_encoded,
+                   card.week_string, card.lesson, card.weeks)
+
+    def in_week(self, week: int) -> bool:
+        return bool(self.weeks_mask >> week & 1)
+
+    @property
+    def weeks(self) -> List[int]:
+        """上课周次列表，从小到大排列"""
+        return [week for week in range(self.weeks_mask.bit_length()) if self.weeks_mask >> week & 1]
@@ -7,6 +7,10 @@ from everyclass.server.utils import JSONSerializable
 from everyclass.server.utils.encryption import encrypt, RTYPE_STUDENT, RTYPE_TEACHER
 
 
+# 大节序号对应的节次字符串，如第 1 大节为 "0102"，作为 schedules 中的 key
+_SESSION_KEYS = {session: f"{session * 2 - 1:02}{session * 2:02}" for session in range(1, 7)}
+
+
 @dataclass
 class Event(JSONSerializable):
     name: str
@@ -66,25 +70,20 @@ class MultiPeopleSchedule(JSONSerializable):
             else:
                 cards = service.get_teacher_timetable(identifier, semester).cards
 
-            cards = filter(lambda c: week in c.weeks and c.lesson[0] == str(day), cards)  # 用日期所属的周次和星期过滤card
+            cards = filter(lambda c: c.in_week(week) and c.day == day, cards)  # 用日期所属的周次和星期过滤card
 
-            event_dict = {}
+            events = {}  # 大节序号 -> Event
             for card in cards:
-                time = card.lesson[1:5]  # "10102" -> "0102"
-                if time not in event_dict:
-                    event_dict[time] = Event(name=card.name, room=card.room)
+                if card.session not in events:
+                    events[card.session] = Event(name=card.name, room=card.room)
                 else:
                     # 课程重叠
                     logger.warning("time of card overlapped", extra={'people_identifier': identifier,
                                                                      'date': date})
 
-            # 给没课的位置补充None
-            for i in range(1, 10, 2):
-                key = f"{i:02}{i + 1:02}"
-                if key not in event_dict:
-                    event_dict[key] = None
-
-            self.schedules.append(event_dict)
+            # 第 1 至 5 大节没课的位置补充None
+            self.schedules.append({_SESSION_KEYS[session]: events.get(session)
+                                   for session in sorted(events.keys() | range(1, 6))})
         self.inaccessible_people = inaccessible_people
         self.accessible_people = accessible_people
 
@@ -0,0 +1,160 @@
+"""
+多人日程搜索的本地自动补全索引
+
+索引文件由一个 worker 定时构建（见 `everyclass.server.cron_rebuild_autocomplete_index`），写入 AUTOCOMPLETE_INDEX_FILE 后原子替换，
+所有 worker 以只读 mmap 打开同一个文件，共享操作系统的页缓存。文件格式（整数均为小端 uint32）：
+
+    magic(4) | 数据版本长度 | 键数量 | 记录数量 | 标志 | 数据版本 | 键偏移表 | 记录偏移表 | 键区 | 记录区
+
+- 键区中每个键为 `小写的键 + b'\\0' + 记录编号`，按字节序排序，前缀查询时对键偏移表二分查找。每个人有姓名、学号/教工号和姓名拼音
+  首字母（需要安装 pypinyin）三个键；
+- 记录区中每条记录是一个人的 JSON；
+- 标志的最低位表示索引是否由全部学生和老师的完整导出构建。不完整的索引（如只包含被搜索过的人）查不到某人不代表此人不存在。
+"""
+import bisect
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+from typing import Dict, Iterable, List, Optional
+
+try:
+    from pypinyin import lazy_pinyin, Style
+except ImportError:
+    lazy_pinyin = None
+
+_MAGIC = b'ECA2'
+_HEADER = struct.Struct('<4sIIII')
+_FLAG_COMPLETE = 1
+_UINT = struct.Struct('<I')
+
+
+def pinyin_initials(name: str) -> Optional[str]:
+    """姓名的拼音首字母，如“张三” -> “zs”。没有安装 pypinyin 时返回 None"""
+    if lazy_pinyin is None:
+        return None
+    return ''.join(lazy_pinyin(name, style=Style.FIRST_LETTER)).lower()
+
+
+def build(path: str, data_version: str, records: Iterable[Dict], complete: bool = False) -> int:
+    """构建索引文件并原子替换 path，返回记录数。每条记录需要包含 id 和 name 字段，records 包含所有人时 complete 为 True"""
+    keys = []
+    record_blobs = []
+    for record_no, record in enumerate(records):
+        record_blobs.append(json.dumps(record, ensure_ascii=False).encode())
+        record_keys = {record['name'].lower(), record['id'].lower(), pinyin_initials(record['name'])}
+        keys.extend(key.encode() + b'\0' + _UINT.pack(record_no) for key in record_keys if key)
+    keys.sort()
+
+    version = data_version.encode()
+    with open(f"{path}.tmp", 'wb') as f:
+        f.write(_HEADER.pack(_MAGIC, len(version), len(keys), len(record_blobs), _FLAG_COMPLETE if complete else 0))
+        f.write(version)
+        for blobs in (keys, record_blobs):
+            offset = 0
+            for blob in blobs:
+                f.write(_UINT.pack(offset))
+                offset += len(blob)
+            f.write(_UINT.pack(offset))
+        for blob in keys:
+            f.write(blob)
+        for blob in record_blobs:
+            f.write(blob)
+    os.replace(f"{path}.tmp", path)
+    return len(record_blobs)
+
+
+class AutocompleteIndex:
+    def __init__(self, path: str):
+        with open(path, 'rb') as f:
+            self._stat = os.fstat(f.fileno())
+            self._buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version_len, self._key_count, self._record_count, flags = _HEADER.unpack_from(self._buf)
+        if magic != _MAGIC:
+            raise ValueError(f"{path} is not an autocomplete index")
+        self.complete = bool(flags & _FLAG_COMPLETE)
+        pos = _HEADER.size
+        self.data_version = self._buf[pos:pos + version_len].decode()
+        pos += version_len
+        self._key_offsets = pos
+        self._record_offsets = self._key_offsets + (self._key_count + 1) * _UINT.size
+        self._keys = self._record_offsets + (self._record_count + 1) * _UINT.size
+        self._records = self._keys + self._offset(self._key_offsets, self._key_count)
+
+    def __len__(self):
+        return self._record_count
+
+    def _offset(self, table: int, i: int) -> int:
+        return _UINT.unpack_from(self._buf, table + i * _UINT.size)[0]
+
+    def _key(self, i: int) -> bytes:
+        start = self._keys + self._offset(self._key_offsets, i)
+        end = self._keys + self._offset(self._key_offsets, i + 1)
+        return self._buf[start:end]
+
+    def _record(self, record_no: int) -> Dict:
+        start = self._records + self._offset(self._record_offsets, record_no)
+        end = self._records + self._offset(self._record_offsets, record_no + 1)
+        return json.loads(self._buf[start:end])
+
+    def search(self, prefix: str, limit: int) -> List[Dict]:
+        """返回键以 prefix 开头（不区分大小写）的人，每人只出现一次，最多 limit 条"""
+        prefix = prefix.lower().encode()
+        keys = _KeyView(self)
+        record_nos = []
+        for i in range(bisect.bisect_left(keys, prefix), self._key_count):
+            key = self._key(i)
+            if not key.startswith(prefix):
+                break
+            record_no = _UINT.unpack_from(key, len(key) - _UINT.size)[0]
+            if record_no not in record_nos:
+                record_nos.append(record_no)
+                if len(record_nos) >= limit:
+                    break
+        return [self._record(record_no) for record_no in record_nos]
+
+    def is_stale(self, path: str) -> bool:
+        """文件是否已经被新构建的索引替换"""
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return True
+        return (stat.st_ino, stat.st_mtime_ns) != (self._stat.st_ino, self._stat.st_mtime_ns)
+
+
+class _KeyView:
+    """把键偏移表包装成序列，供 bisect 二分查找"""
+
+    def __init__(self, index: AutocompleteIndex):
+        self._index = index
+
+    def __len__(self):
+        return self._index._key_count
+
+    def __getitem__(self, i: int) -> bytes:
+        return self._index._key(i)
+
+
+_index: Optional[AutocompleteIndex] = None
+_checked_at = 0.0
+_lock = threading.Lock()
+
+
+def get_index(path: str, data_version: str, check_interval: float) -> Optional[AutocompleteIndex]:
+    """获得当前进程打开的索引，每 check_interval 秒检查一次文件是否被替换。索引不存在或数据版本不一致时返回 None"""
+    global _index, _checked_at
+
+    if time.monotonic() - _checked_at > check_interval:
+        with _lock:
+            if time.monotonic() - _checked_at > check_interval:
+                _checked_at = time.monotonic()
+                if _index is None or _index.is_stale(path):
+                    try:
+                        _index = AutocompleteIndex(path)
+                    except (FileNotFoundError, ValueError):
+                        _index = None
+    index = _index
+    return index if index is not None and index.data_version == data_version else None
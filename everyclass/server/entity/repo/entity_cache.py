@@ -0,0 +1,41 @@
+import pickle
+import time
+from typing import Any, Optional, Tuple
+
+from everyclass.server.utils.db.redis import redis, redis_prefix
+
+FORMAT_VERSION = 3  # 缓存对象的结构或 key 的格式变化时（如课程转换为 Card）递增，旧格式的缓存不再被读取
+
+_STALE = 'stale'
+
+
+def _key(name: str, params: tuple, data_version: Optional[str]) -> str:
+    """data_version 为 None 时是不区分数据版本的备份，只在上游不可用时读取"""
+    version = _STALE if data_version is None else data_version
+    return f"{redis_prefix}:entity_cache:v{FORMAT_VERSION}:{version}:{name}:{':'.join(map(str, params))}"
+
+
+def get(name: str, params: tuple, data_version: str) -> Optional[Tuple[float, Any]]:
+    """获得当前数据版本下缓存的上游结果，返回 (写入时间戳, 结果)，没有缓存时返回 None"""
+    data = redis.get(_key(name, params, data_version))
+    return pickle.loads(data) if data else None
+
+
+def get_stale(name: str, params: tuple) -> Optional[Tuple[float, Any]]:
+    """获得最近一次成功的上游结果，可能属于之前的数据版本，只在上游不可用时使用"""
+    data = redis.get(_key(name, params, None))
+    return pickle.loads(data) if data else None
+
+
+def set(name: str, params: tuple, data_version: str, result: Any, expire: int, stale_expire: int) -> None:
+    """缓存上游结果，同时更新不区分数据版本的备份"""
+    data = pickle.dumps((time.time(), result))
+    with redis.pipeline(transaction=False) as pipe:
+        pipe.set(_key(name, params, data_version), data, ex=expire)
+        pipe.set(_key(name, params, None), data, ex=stale_expire)
+        pipe.execute()
+
+
+def lock_refresh(name: str, params: tuple, data_version: str, timeout: int) -> bool:
+    """抢占后台刷新的锁，保证同一时间只有一个 worker 在刷新这条缓存。锁在 timeout 秒后自动过期"""
+    return bool(redis.set(f"{_key(name, params, data_version)}:refreshing", 1, nx=True, ex=timeout))
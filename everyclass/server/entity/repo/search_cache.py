@@ -0,0 +1,62 @@
+import pickle
+from typing import Dict, Iterable, Iterator, Optional, Tuple, Union
+
+from everyclass.rpc.entity import SearchResult, SearchResultStudentItem, SearchResultTeacherItem
+from everyclass.server.utils.db.redis import redis, redis_prefix
+
+CACHE_TTL = 60 * 60 * 24  # 数据版本是 key 的一部分，数据更新后旧缓存不会再被读取，过期时间仅用于回收内存
+
+People = Tuple[bool, Union[SearchResultStudentItem, SearchResultTeacherItem]]
+
+
+def _result_key(keyword: str, data_version: str) -> str:
+    return f"{redis_prefix}:search_cache:{data_version}:{keyword}"
+
+
+def _index_key(data_version: str) -> str:
+    return f"{redis_prefix}:people_index:{data_version}"
+
+
+def get_result(keyword: str, data_version: str) -> Optional[SearchResult]:
+    """获得缓存的搜索结果，没有缓存时返回 None"""
+    data = redis.get(_result_key(keyword, data_version))
+    return pickle.loads(data) if data else None
+
+
+def set_result(keyword: str, data_version: str, result: SearchResult) -> None:
+    """缓存搜索结果，同时把结果中的每个学生和老师写入学号/教工号索引"""
+    pipeline = redis.pipeline(transaction=False)
+    pipeline.set(_result_key(keyword, data_version), pickle.dumps(result), ex=CACHE_TTL)
+    _add_people(pipeline, data_version, [(True, student) for student in result.students] +
+                [(False, teacher) for teacher in result.teachers])
+    pipeline.execute()
+
+
+def add_people(data_version: str, people: Iterable[People]) -> None:
+    """把学生或老师写入学号/教工号索引"""
+    pipeline = redis.pipeline(transaction=False)
+    _add_people(pipeline, data_version, people)
+    pipeline.execute()
+
+
+def _add_people(pipeline, data_version: str, people: Iterable[People]) -> None:
+    mapping = {(item.student_id if is_student else item.teacher_id): pickle.dumps((is_student, item))
+               for is_student, item in people}
+    if mapping:
+        pipeline.hset(_index_key(data_version), mapping=mapping)
+        pipeline.expire(_index_key(data_version), CACHE_TTL)
+
+
+def get_people(identifiers: Iterable[str], data_version: str) -> Dict[str, People]:
+    """从索引中批量获得学生或老师的基本信息，返回学号或教工号到 (是否为学生, 基本信息) 的映射，索引中没有的人不会出现在结果中"""
+    identifiers = list(identifiers)
+    if not identifiers:
+        return {}
+    values = redis.hmget(_index_key(data_version), identifiers)
+    return {identifier: pickle.loads(value) for identifier, value in zip(identifiers, values) if value}
+
+
+def iter_people(data_version: str) -> Iterator[People]:
+    """遍历索引中当前数据版本的所有学生和老师"""
+    for _, value in redis.hscan_iter(_index_key(data_version), count=1000):
+        yield pickle.loads(value)
@@ -0,0 +1,19 @@
+from typing import Optional
+
+from everyclass.server.utils.db.redis import redis, redis_prefix
+
+FRAGMENT_TTL = 60 * 60 * 24  # 数据版本是 key 的一部分，数据更新后旧片段不会再被读取，过期时间仅用于回收内存
+
+
+def _key(resource_type: str, identifier: str, semester: str, data_version: str) -> str:
+    return f"{redis_prefix}:timetable_fragment:{resource_type}:{identifier}:{semester}:{data_version}"
+
+
+def get_fragment(resource_type: str, identifier: str, semester: str, data_version: str) -> Optional[str]:
+    """获得已渲染的课表表格 HTML 片段，没有缓存时返回 None"""
+    fragment = redis.get(_key(resource_type, identifier, semester, data_version))
+    return fragment.decode() if fragment else None
+
+
+def set_fragment(resource_type: str, identifier: str, semester: str, data_version: str, fragment: str) -> None:
+    redis.set(_key(resource_type, identifier, semester, data_version), fragment, ex=FRAGMENT_TTL)
@@ -0,0 +1,129 @@
+"""
+当前学期课表的只读快照
+
+快照文件由 `flask build-timetable-snapshot` 命令在数据更新后构建，写入 TIMETABLE_SNAPSHOT_FILE 后原子替换。所有 worker 以只读 mmap
+打开同一个文件，共享操作系统的页缓存，进程自身只保存偏移表的位置。文件格式（整数均为小端 uint32）：
+
+    magic(4) | 数据版本长度 | 学期长度 | 条目数量 | 数据版本 | 学期 | 键偏移表 | 值偏移表 | 键区 | 值区
+
+键形如 `student:<学号>`、`teacher:<教工号>`、`room:<教室ID>`、`card:<课程ID>`，按字节序排序，查询时对键偏移表二分查找；值为 RPC 结果
+对象的 pickle，读取时直接从 mmap 的 memoryview 反序列化，不复制文件内容。
+"""
+import bisect
+import mmap
+import os
+import pickle
+import struct
+import tempfile
+import threading
+import time
+from typing import Any, Iterable, Optional, Tuple
+
+_MAGIC = b'ECT2'
+_HEADER = struct.Struct('<4sIII')
+_UINT = struct.Struct('<I')
+
+
+def build(path: str, data_version: str, semester: str, entries: Iterable[Tuple[str, Any]]) -> int:
+    """
+    构建快照文件并原子替换 path，返回条目数。entries 为 (键, RPC 结果) 的序列。
+
+    值按到达顺序序列化到临时文件，内存中只保留键和值在临时文件中的位置；键排序后再按顺序把值复制到快照文件中。
+    """
+    index = []  # (键, 值在临时文件中的偏移, 值的长度)
+    with tempfile.TemporaryFile(dir=os.path.dirname(path) or None) as values:
+        for key, value in entries:
+            value = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+            index.append((key.encode(), values.tell(), len(value)))
+            values.write(value)
+        index.sort()
+        data_version, semester = data_version.encode(), semester.encode()
+
+        with open(f"{path}.tmp", 'wb') as f:
+            f.write(_HEADER.pack(_MAGIC, len(data_version), len(semester), len(index)))
+            f.write(data_version)
+            f.write(semester)
+            for lengths in ((len(key) for key, _, _ in index), (length for _, _, length in index)):
+                offset = 0
+                for length in lengths:
+                    f.write(_UINT.pack(offset))
+                    offset += length
+                f.write(_UINT.pack(offset))
+            for key, _, _ in index:
+                f.write(key)
+            for _, position, length in index:
+                values.seek(position)
+                f.write(values.read(length))
+    os.replace(f"{path}.tmp", path)
+    return len(index)
+
+
+class TimetableSnapshot:
+    def __init__(self, path: str):
+        with open(path, 'rb') as f:
+            self._stat = os.fstat(f.fileno())
+            self._buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = memoryview(self._buf)
+
+        magic, version_len, semester_len, self._count = _HEADER.unpack_from(self._buf)
+        if magic != _MAGIC:
+            raise ValueError(f"{path} is not a timetable snapshot")
+        pos = _HEADER.size
+        self.data_version = self._buf[pos:pos + version_len].decode()
+        pos += version_len
+        self.semester = self._buf[pos:pos + semester_len].decode()
+        pos += semester_len
+        self._key_offsets = pos
+        self._value_offsets = self._key_offsets + (self._count + 1) * _UINT.size
+        self._keys = self._value_offsets + (self._count + 1) * _UINT.size
+        self._values = self._keys + self._offset(self._key_offsets, self._count)
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, i: int) -> bytes:
+        """第 i 个键，供 bisect 二分查找"""
+        return self._buf[self._keys + self._offset(self._key_offsets, i):self._keys + self._offset(self._key_offsets, i + 1)]
+
+    def _offset(self, table: int, i: int) -> int:
+        return _UINT.unpack_from(self._buf, table + i * _UINT.size)[0]
+
+    def get(self, key: str) -> Optional[Any]:
+        """按键获得 RPC 结果，快照中没有时返回 None"""
+        key = key.encode()
+        i = bisect.bisect_left(self, key)
+        if i == self._count or self[i] != key:
+            return None
+        start = self._values + self._offset(self._value_offsets, i)
+        end = self._values + self._offset(self._value_offsets, i + 1)
+        return pickle.loads(self._view[start:end])
+
+    def is_stale(self, path: str) -> bool:
+        """文件是否已经被新构建的快照替换"""
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return True
+        return (stat.st_ino, stat.st_mtime_ns) != (self._stat.st_ino, self._stat.st_mtime_ns)
+
+
+_snapshot: Optional[TimetableSnapshot] = None
+_checked_at = 0.0
+_lock = threading.Lock()
+
+
+def get_snapshot(path: str, data_version: str, check_interval: float) -> Optional[TimetableSnapshot]:
+    """获得当前进程打开的快照，每 check_interval 秒检查一次文件是否被替换。快照不存在或数据版本不一致时返回 None"""
+    global _snapshot, _checked_at
+
+    if time.monotonic() - _checked_at > check_interval:
+        with _lock:
+            if time.monotonic() - _checked_at > check_interval:
+                _checked_at = time.monotonic()
+                if _snapshot is None or _snapshot.is_stale(path):
+                    try:
+                        _snapshot = TimetableSnapshot(path)
+                    except (FileNotFoundError, ValueError):
+                        _snapshot = None
+    snapshot = _snapshot
+    return snapshot if snapshot is not None and snapshot.data_version == data_version else None
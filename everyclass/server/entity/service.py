@@ -1,52 +1,251 @@
 import datetime
-from typing import Tuple, Union, List
+import functools
+import inspect
+import unicodedata
+from typing import Dict, Iterable, List, Tuple, Union
 
+from flask import current_app
 from sqlalchemy.exc import IntegrityError
 
+from everyclass.rpc import ensure_slots
 from everyclass.rpc.entity import SearchResultStudentItem, SearchResultTeacherItem, Entity, SearchResult, CardResult
-from everyclass.server.entity.domain import replace_exception
+from everyclass.server.entity.domain import current_data_version, replace_exception, serve_stale
 from everyclass.server.entity.exceptions import AlreadyReported
-from everyclass.server.entity.model import MultiPeopleSchedule, AllRooms, AvailableRooms, UnavailableRoomReport
+from everyclass.server.entity.model import MultiPeopleSchedule, AllRooms, AvailableRooms, UnavailableRoomReport, Card
+from everyclass.server.entity.repo import autocomplete_index, search_cache, timetable_snapshot
+from everyclass.server.utils import base_exceptions
+from everyclass.server.utils.circuit_breaker import UPSTREAM_ENTITY, circuit_breaker, get_breaker
+from everyclass.server.utils.config import get_config
+from everyclass.server.utils.single_flight import single_flight
+
+
+def normalize_keyword(keyword: str) -> str:
+    """去除首尾空白并把全角字符转为半角，使同一个学号、姓名的不同写法命中同一份缓存"""
+    return unicodedata.normalize('NFKC', keyword).strip()
+
+
+@single_flight
+@circuit_breaker(UPSTREAM_ENTITY)
+def _search(keyword: str) -> SearchResult:
+    return Entity.search(keyword)
 
 
 @replace_exception
 def search(keyword: str) -> SearchResult:
-    return Entity.search(keyword)
+    """
+    搜索学生、老师和教室。结果按规范化后的关键词和数据版本缓存在 Redis 中，结果里的每个人同时会被写入学号/教工号索引，
+    供 get_people_info 直接查询。返回的结果可能被多个请求共享，不能修改。
+    """
+    keyword = normalize_keyword(keyword)
+    data_version = current_data_version()
+    if data_version is None:
+        return _search(keyword)
+
+    result = search_cache.get_result(keyword, data_version)
+    if result is None:
+        result = _search(keyword)
+        search_cache.set_result(keyword, data_version, result)
+    return result
+
+
+def _people_record(people: Union[SearchResultStudentItem, SearchResultTeacherItem], is_student: bool) -> Dict:
+    if is_student:
+        return {'type': 'student', 'id': people.student_id, 'id_encoded': people.student_id_encoded, 'name': people.name,
+                'description': people.deputy + people.klass, 'klass': people.klass}
+    return {'type': 'teacher', 'id': people.teacher_id, 'id_encoded': people.teacher_id_encoded, 'name': people.name,
+            'description': people.unit + people.title, 'klass': None}
+
+
+def autocomplete(keyword: str) -> List[Dict]:
+    """
+    按姓名、学号/教工号或姓名拼音首字母的前缀查找学生和老师，供多人日程搜索框使用。
+
+    本地自动补全索引由全部学生和老师的完整导出构建时，直接返回索引中的结果，不请求上游。目前索引只由被搜索过的人构建（见
+    rebuild_autocomplete_index），查不到不代表不存在，因此仍然请求上游搜索（结果有缓存）：索引命中的人排在前面，其余的人按上游
+    搜索结果的顺序排在后面。上游不可用时只返回索引中的结果。
+
+    返回的每个人形如 {"type": "student"|"teacher", "id": "", "id_encoded": "", "name": "", "description": "", "klass": ""}
+    """
+    keyword = normalize_keyword(keyword)
+    indexed = []
+    data_version = current_data_version()
+    if data_version is not None:
+        config = get_config()
+        index = autocomplete_index.get_index(config.AUTOCOMPLETE_INDEX_FILE, data_version,
+                                             config.AUTOCOMPLETE_RELOAD_INTERVAL)
+        if index is not None:
+            indexed = index.search(keyword, config.AUTOCOMPLETE_LIMIT)
+            if indexed and index.complete:
+                return indexed
+
+    try:
+        search_result = search(keyword)
+    except base_exceptions.InternalError:
+        if indexed:
+            return indexed
+        raise
+    seen = {people['id'] for people in indexed}
+    searched = [_people_record(s, True) for s in search_result.students] + \
+               [_people_record(t, False) for t in search_result.teachers]
+    return indexed + [people for people in searched if people['id'] not in seen]
+
+
+def rebuild_autocomplete_index(data_version: str) -> int:
+    """
+    用学号/教工号索引中当前数据版本的所有人重建自动补全索引文件，返回索引中的人数。学号/教工号索引只包含被搜索或查询过的人，
+    所以构建的索引是不完整的
+    """
+    records = (_people_record(people, is_student) for is_student, people in search_cache.iter_people(data_version))
+    return autocomplete_index.build(get_config().AUTOCOMPLETE_INDEX_FILE, data_version, records, complete=False)
+
+
+def _from_snapshot(resource_type: str):
+    """
+    配置了 TIMETABLE_SNAPSHOT_FILE 时，先从当前学期的课表快照中读取（见 repo/timetable_snapshot.py），快照中没有时再请求上游。
+    被装饰函数的参数为 semester 和资源 ID（顺序不限，可以按位置或关键字传入）
+    """
+
+    def decorator(func):
+        signature = inspect.signature(func)
+        id_parameter = next(name for name in signature.parameters if name != 'semester')
+
+        @functools.wraps(func)
+        def wrapped(*args, **kwargs):
+            config = get_config()
+            data_version = current_data_version()
+            if config.TIMETABLE_SNAPSHOT_FILE and data_version:
+                snapshot = timetable_snapshot.get_snapshot(config.TIMETABLE_SNAPSHOT_FILE, data_version,
+                                                           config.TIMETABLE_SNAPSHOT_RELOAD_INTERVAL)
+                arguments = signature.bind(*args, **kwargs).arguments
+                if snapshot and snapshot.semester == arguments['semester']:
+                    result = snapshot.get(f"{resource_type}:{arguments[id_parameter]}")
+                    if result is not None:
+                        return result
+            return func(*args, **kwargs)
+
+        return wrapped
+
+    return decorator
+
+
+def _compact_cards(timetable):
+    """在 RPC 边界把课表中的课程转换为紧凑的 Card，之后的缓存、快照和渲染都使用转换后的对象"""
+    timetable.cards = [Card.from_rpc(card) for card in timetable.cards]
+    return timetable
+
+
+def build_timetable_snapshot(data_version: str, semester: str) -> int:
+    """
+    为学期构建课表快照文件，返回条目数。entity 服务没有全量导出接口，学生和老师来自学号/教工号索引（搜索时写入），教室来自教室列表，
+    课程来自这些课表中出现的所有课程。
+    """
+    from everyclass.server import logger
+    from everyclass.server.utils.encryption import decrypt
+
+    def entries():
+        card_ids = set()
+        for is_student, people in search_cache.iter_people(data_version):
+            if semester not in people.semesters:
+                continue
+            if is_student:
+                key, timetable = f"student:{people.student_id}", _compact_cards(Entity.get_student_timetable(people.student_id, semester))
+            else:
+                key, timetable = f"teacher:{people.teacher_id}", _compact_cards(Entity.get_teacher_timetable(people.teacher_id, semester))
+            card_ids.update(card.card_id_encoded for card in timetable.cards)
+            yield key, timetable
+        for campus in get_rooms().campuses.values():
+            for building in campus.buildings:
+                for room in building.rooms:
+                    timetable = _compact_cards(Entity.get_classroom_timetable(semester, room.room_id))
+                    card_ids.update(card.card_id_encoded for card in timetable.cards)
+                    yield f"room:{room.room_id}", timetable
+        logger.info(f"Fetching {len(card_ids)} cards for timetable snapshot")
+        for card_id_encoded in card_ids:
+            card_id = decrypt(card_id_encoded, resource_type='klass')[1]
+            yield f"card:{card_id}", Entity.get_card(semester, card_id)
+
+    return timetable_snapshot.build(get_config().TIMETABLE_SNAPSHOT_FILE, data_version, semester, entries())
+
+
+def _index_people(is_student: bool, people) -> None:
+    """
+    把 get_student/get_teacher 的结果转换为搜索结果中的类型写入学号/教工号索引，没有被搜索过、只通过链接访问过的人也能被
+    get_people_info 直接查到
+    """
+    data_version = current_data_version()
+    if data_version is None:
+        return
+    item_type = SearchResultStudentItem if is_student else SearchResultTeacherItem
+    search_cache.add_people(data_version, [(is_student, item_type(**ensure_slots(item_type, dict(vars(people)))))])
 
 
 @replace_exception
+@serve_stale
+@single_flight
+@circuit_breaker(UPSTREAM_ENTITY)
 def get_student(student_id: str):
-    return Entity.get_student(student_id)
+    student = Entity.get_student(student_id)
+    _index_people(True, student)
+    return student
 
 
 @replace_exception
+@_from_snapshot('student')
+@serve_stale
+@single_flight
+@circuit_breaker(UPSTREAM_ENTITY)
 def get_student_timetable(student_id: str, semester: str):
-    return Entity.get_student_timetable(student_id, semester)
+    return _compact_cards(Entity.get_student_timetable(student_id, semester))
 
 
 @replace_exception
+@_from_snapshot('teacher')
+@serve_stale
+@single_flight
+@circuit_breaker(UPSTREAM_ENTITY)
 def get_teacher_timetable(teacher_id: str, semester: str):
-    return Entity.get_teacher_timetable(teacher_id, semester)
+    return _compact_cards(Entity.get_teacher_timetable(teacher_id, semester))
 
 
 @replace_exception
+@_from_snapshot('room')
+@serve_stale
+@single_flight
+@circuit_breaker(UPSTREAM_ENTITY)
 def get_classroom_timetable(semester: str, room_id: str):
-    return Entity.get_classroom_timetable(semester, room_id)
+    return _compact_cards(Entity.get_classroom_timetable(semester, room_id))
 
 
 @replace_exception
+@_from_snapshot('card')
+@serve_stale
+@single_flight
+@circuit_breaker(UPSTREAM_ENTITY)
 def get_card(semester: str, card_id: str) -> CardResult:
     return Entity.get_card(semester, card_id)
 
 
 @replace_exception
+@serve_stale
+@single_flight
+@circuit_breaker(UPSTREAM_ENTITY)
 def get_teacher(teacher_id: str):
-    return Entity.get_teacher(teacher_id)
+    teacher = Entity.get_teacher(teacher_id)
+    _index_people(False, teacher)
+    return teacher
+
+
+_rooms_cache: Dict[str, AllRooms] = {}
 
 
 @replace_exception
 def get_rooms():
-    return AllRooms.make(Entity.get_rooms())
+    """教室列表只随数据版本变化，每个进程按数据版本缓存一份（worker 启动时预取，见 utils/warmup.py）"""
+    data_version = current_app.config['DATA_LAST_UPDATE_TIME']
+    if data_version not in _rooms_cache:
+        _rooms_cache.clear()
+        _rooms_cache[data_version] = AllRooms.make(get_breaker(UPSTREAM_ENTITY).call(Entity.get_rooms))
+    return _rooms_cache[data_version]
 
 
 @replace_exception
@@ -76,6 +275,12 @@ def get_people_info(identifier: str) -> Tuple[bool, Union[SearchResultStudentIte
      the identifier is not found, a PeopleNotFoundError is raised. The second parameter is the info of student or
      teacher.
     """
+    data_version = current_data_version()
+    if data_version:
+        people = search_cache.get_people([identifier], data_version)
+        if identifier in people:
+            return people[identifier]
+
     result = search(identifier)
     if len(result.students) > 0:
         return True, result.students[0]
@@ -84,6 +289,24 @@ def get_people_info(identifier: str) -> Tuple[bool, Union[SearchResultStudentIte
     raise PeopleNotFoundError
 
 
+def get_people_info_batch(identifiers: Iterable[str]) -> Dict[str, Union[SearchResultStudentItem, SearchResultTeacherItem]]:
+    """
+    批量获得多个人的基本信息，返回学号或教工号到基本信息的映射，查不到的人不会出现在结果中
+
+    entity 服务目前没有批量查询接口，这里先对标识去重并从学号/教工号索引中批量读取，只有索引中没有的人才逐个查询。
+    """
+    identifiers = set(identifiers)
+    data_version = current_data_version()
+    result = {identifier: people[1] for identifier, people in search_cache.get_people(identifiers, data_version).items()} \
+        if data_version else {}
+    for identifier in identifiers - result.keys():
+        try:
+            result[identifier] = get_people_info(identifier)[1]
+        except PeopleNotFoundError:
+            continue
+    return result
+
+
 def multi_people_schedule(people: List[str], date: datetime.date, current_user: str) -> MultiPeopleSchedule:
     """多人日程展示。输入学号或教工号列表及日期，输出多人在当天的日程。
 
@@ -2,13 +2,18 @@ from collections import defaultdict
 from typing import Dict, List, Tuple
 
 from ddtrace import tracer
-from flask import Blueprint, current_app as app, escape, flash, redirect, render_template, request, session, url_for
+from flask import Blueprint, Markup, current_app as app, escape, flash, g, redirect, render_template, request, session, \
+    url_for
+from htmlmin import minify
 
 from everyclass.common.format import contains_chinese
 from everyclass.common.time import get_day_chinese, get_time_chinese, lesson_string_to_tuple
 from everyclass.server import logger
 from everyclass.server.entity import service as entity_service
 from everyclass.server.entity.domain import semester_calculate
+from everyclass.server.entity.model import Card
+from everyclass.server.entity.repo import timetable_fragment
+from everyclass.server.utils import maintenance
 from everyclass.server.utils.encryption import decrypt
 from everyclass.server.utils.session import StudentSession
 from everyclass.server.utils.web_consts import MSG_INVALID_IDENTIFIER, SESSION_LAST_VIEWED_STUDENT, URL_EMPTY_SEMESTER
@@ -32,7 +37,7 @@ def query():
     """
 
     # if under maintenance, return to maintenance.html
-    if app.config["MAINTENANCE"]:
+    if maintenance.enabled:
         return render_template("maintenance.html")
 
     keyword = request.values.get('id')
@@ -163,23 +168,13 @@ def get_student(url_sid: str, url_semester: str):
 
     if url_semester != URL_EMPTY_SEMESTER:
         with tracer.trace('process_rpc_result'):
-            cards: Dict[Tuple[int, int], List[Dict[str, str]]] = dict()
-            for card in student.cards:
-                day, time = lesson_string_to_tuple(card.lesson)
-                if (day, time) not in cards:
-                    cards[(day, time)] = list()
-                cards[(day, time)].append(card)
-            empty_5, empty_6, empty_sat, empty_sun = _empty_column_check(cards)
+            timetable = _timetable_fragment('student', student.student_id, url_semester, student.cards)
             available_semesters = semester_calculate(url_semester, sorted(student.semesters))
 
         return render_template('entity/student.html',
                                have_semesters=True,
                                student=student,
-                               cards=cards,
-                               empty_sat=empty_sat,
-                               empty_sun=empty_sun,
-                               empty_6=empty_6,
-                               empty_5=empty_5,
+                               timetable=timetable,
                                available_semesters=available_semesters,
                                current_semester=url_semester)
     else:
@@ -217,25 +212,14 @@ def get_teacher(url_tid, url_semester):
 
     if url_semester != URL_EMPTY_SEMESTER:
         with tracer.trace('process_rpc_result'):
-            cards = defaultdict(list)
-            for card in teacher.cards:
-                day, time = lesson_string_to_tuple(card.lesson)
-                if (day, time) not in cards:
-                    cards[(day, time)] = list()
-                cards[(day, time)].append(card)
-
-        empty_5, empty_6, empty_sat, empty_sun = _empty_column_check(cards)
+            timetable = _timetable_fragment('teacher', teacher.teacher_id, url_semester, teacher.cards)
 
         available_semesters = semester_calculate(url_semester, teacher.semesters)
 
         return render_template('entity/teacher.html',
                                have_semesters=True,
                                teacher=teacher,
-                               cards=cards,
-                               empty_sat=empty_sat,
-                               empty_sun=empty_sun,
-                               empty_6=empty_6,
-                               empty_5=empty_5,
+                               timetable=timetable,
                                available_semesters=available_semesters,
                                current_semester=url_semester)
     else:
@@ -264,22 +248,13 @@ def get_classroom(url_rid, url_semester):
         return handle_exception_with_error_page(e)
 
     with tracer.trace('process_rpc_result'):
-        cards = defaultdict(list)
-        for card in room.cards:
-            day, time = lesson_string_to_tuple(card.lesson)
-            cards[(day, time)].append(card)
-
-    empty_5, empty_6, empty_sat, empty_sun = _empty_column_check(cards)
+        timetable = _timetable_fragment('room', room_id, url_semester, room.cards)
 
     available_semesters = semester_calculate(url_semester, room.semesters)
 
     return render_template('entity/room.html',
                            room=room,
-                           cards=cards,
-                           empty_sat=empty_sat,
-                           empty_sun=empty_sun,
-                           empty_6=empty_6,
-                           empty_5=empty_5,
+                           timetable=timetable,
                            available_semesters=available_semesters,
                            current_semester=url_semester)
 
@@ -329,6 +304,41 @@ def multi_people_schedule():
     return render_template("entity/multi_people_schedule.html")
 
 
+def _timetable_fragment(resource_type: str, identifier: str, semester: str, rpc_cards: List[Card]) -> Markup:
+    """
+    获得课表表格的 HTML 片段。
+
+    表格内容只取决于资源、学期和 entity 数据版本，与访问者无关，因此渲染并压缩后缓存在 Redis 中，命中时跳过分组、渲染和压缩。
+    登录状态、隐私提示等与用户有关的内容在片段之外渲染。
+
+    :param resource_type: student、teacher 或 room，对应 `entity/_timetable_<resource_type>.html` 模板
+    :param identifier: 学号、教工号或教室 ID
+    :param semester: 学期字符串
+    :param rpc_cards: 课程（Card）列表，仅在缓存未命中时使用
+    """
+    data_version = app.config['DATA_LAST_UPDATE_TIME']
+    fragment = timetable_fragment.get_fragment(resource_type, identifier, semester, data_version)
+    if fragment is None:
+        cards: Dict[Tuple[int, int], List] = defaultdict(list)
+        for card in rpc_cards:
+            cards[(card.day, card.session)].append(card)
+        empty_5, empty_6, empty_sat, empty_sun = _empty_column_check(cards)
+
+        fragment = render_template(f'entity/_timetable_{resource_type}.html',
+                                   cards=cards,
+                                   empty_sat=empty_sat,
+                                   empty_sun=empty_sun,
+                                   empty_6=empty_6,
+                                   empty_5=empty_5,
+                                   current_semester=semester)
+        if app.config['HTML_MINIFY']:
+            fragment = minify(fragment)
+        # 上游不可用时课程来自之前数据版本的缓存，不能以当前数据版本写入片段缓存
+        if not g.get('entity_data_stale', False):
+            timetable_fragment.set_fragment(resource_type, identifier, semester, data_version, fragment)
+    return Markup(fragment)
+
+
 def _empty_column_check(cards: dict) -> Tuple[bool, bool, bool, bool]:
     """检查是否周末和晚上有课，返回三个布尔值"""
     with tracer.trace('_empty_column_check'):
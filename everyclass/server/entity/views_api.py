@@ -1,7 +1,7 @@
 import datetime
 import re
 
-from flask import Blueprint, request, session
+from flask import Blueprint, request
 
 from everyclass.server.entity import service as entity_service
 from everyclass.server.entity.model import SearchResultItem
@@ -31,36 +31,25 @@ def multi_people_schedule():
     return generate_success_response(schedule)
 
 
+def _is_eligible(klass: str) -> bool:
+    """过滤已经毕业的学生"""
+    groups = re.findall(r'\d+', klass)
+    return not groups or int(groups[0][:2]) + 5 >= datetime.date.today().year - 2000
+
+
 @entity_api_bp.route('/multi_people_schedule/_search')
 def multi_people_schedule_search():
     keyword = request.args.get('keyword')
     if not keyword:
         return generate_error_response(None, api_helpers.STATUS_CODE_INVALID_REQUEST, 'missing keyword parameter')
 
-    print([request.cookies.get('e_session')])
-
-    search_result = entity_service.search(keyword)
+    people = entity_service.autocomplete(keyword)
+    people = [p for p in people if p['type'] == 'teacher' or _is_eligible(p['klass'])]
 
     uid = get_logged_in_uid()
+    access = user_service.has_access_batch([p['id'] for p in people], uid)
 
-    print(f"session:{session.values()} \n uid:{uid}")
-
-    items = []
-    for s in search_result.students:
-        eligible = False
-        groups = re.findall(r'\d+', s.klass)
-        if len(groups) > 0:
-            if int(groups[0][:2]) + 5 >= datetime.date.today().year - 2000:
-                eligible = True
-        else:
-            eligible = True
-
-        if eligible:
-            items.append(SearchResultItem(s.name, s.deputy + s.klass, "student", s.student_id_encoded,
-                                          *user_service.has_access(s.student_id, uid, False)))
-
-    items.extend([SearchResultItem(t.name, t.unit + t.title, "teacher", t.teacher_id_encoded,
-                                   *user_service.has_access(t.teacher_id, uid, False)) for t in search_result.teachers])
+    items = [SearchResultItem(p['name'], p['description'], p['type'], p['id_encoded'], *access[p['id']]) for p in people]
     return generate_success_response({'items': items, 'keyword': keyword, 'is_guest': True if uid is None else False})
 
 
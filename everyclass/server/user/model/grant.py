@@ -1,11 +1,11 @@
-from typing import List, Optional
+from typing import List, Optional, Set
 
 from sqlalchemy import Column, String, DateTime, Integer
 from sqlalchemy.dialects.postgresql import ENUM
 from sqlalchemy.orm.exc import NoResultFound
 from sqlalchemy.sql import func
 
-from everyclass.server.utils.db.postgres import Base, db_session
+from everyclass.server.utils.db.postgres import Base, db_session, read_session
 from everyclass.server.utils.encryption import encrypt, RTYPE_STUDENT, RTYPE_TEACHER
 from everyclass.server.utils.jsonable import JSONSerializable
 
@@ -70,7 +70,7 @@ class Grant(Base, JSONSerializable):
     def has_grant(cls, user_id: str, to_user_id: str) -> bool:
         """检查是否有访问授权，user_id为访问的人，to_user_id为被访问的人"""
         try:
-            result = db_session.query(cls). \
+            result = read_session().query(cls). \
                 filter(cls.user_id == user_id). \
                 filter(cls.to_user_id == to_user_id). \
                 filter(cls.status == GRANT_STATUS_VALID).all()
@@ -81,6 +81,15 @@ class Grant(Base, JSONSerializable):
         except NoResultFound:
             return False
 
+    @classmethod
+    def granted_users(cls, user_id: str, to_user_ids: List[str]) -> Set[str]:
+        """在 to_user_ids 中找出 user_id 有访问授权的人"""
+        result = read_session().query(cls.to_user_id). \
+            filter(cls.user_id == user_id). \
+            filter(cls.to_user_id.in_(to_user_ids)). \
+            filter(cls.status == GRANT_STATUS_VALID).all()
+        return {row.to_user_id for row in result}
+
     @classmethod
     def request_for_grant(cls, user_id: str, to_user_id: str) -> "Grant":
         from everyclass.server.user.exceptions import AlreadyGranted
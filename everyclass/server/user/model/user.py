@@ -7,7 +7,7 @@ from sqlalchemy.orm.exc import NoResultFound
 from werkzeug.security import check_password_hash, generate_password_hash
 
 from everyclass.server.user.exceptions import AlreadyRegisteredError
-from everyclass.server.utils.db.postgres import Base, db_session
+from everyclass.server.utils.db.postgres import Base, db_session, read_session
 
 
 class User(Base):
@@ -49,7 +49,7 @@ class User(Base):
     def get_by_id(cls, identifier: str) -> Optional["User"]:
         """通过学号或教工号获取用户，如果获取不到返回none"""
         try:
-            return db_session.query(User).filter(User.identifier == identifier).one()
+            return read_session().query(User).filter(User.identifier == identifier).one()
         except NoResultFound:
             return None
 
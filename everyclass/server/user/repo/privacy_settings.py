@@ -1,22 +1,37 @@
 import datetime
+from typing import Dict, Iterable
 
 from everyclass.server.utils.config import get_config
 from everyclass.server.utils.db import pg_conn_context
+from everyclass.server.utils.db.prepared import PreparedStatement
+
+_select_level = PreparedStatement("privacy_select_level", "SELECT level FROM privacy_settings WHERE student_id=%s")
+_select_levels = PreparedStatement("privacy_select_levels",
+                                   "SELECT student_id, level FROM privacy_settings WHERE student_id = ANY(%s)")
+_upsert_level = PreparedStatement("privacy_upsert_level", """
+        INSERT INTO privacy_settings (student_id, level, create_time) VALUES (%s,%s,%s)
+            ON CONFLICT (student_id) DO UPDATE SET level=EXCLUDED.level
+        """)
 
 
 def get_level(student_id: str) -> int:
-    with pg_conn_context() as conn, conn.cursor() as cursor:
-        select_query = "SELECT level FROM privacy_settings WHERE student_id=%s"
-        cursor.execute(select_query, (student_id,))
+    with pg_conn_context(read_only=True) as conn, conn.cursor() as cursor:
+        _select_level.execute(cursor, (student_id,))
         result = cursor.fetchone()
     return result[0] if result is not None else get_config().DEFAULT_PRIVACY_LEVEL
 
 
+def get_levels(student_ids: Iterable[str]) -> Dict[str, int]:
+    """批量获得隐私级别，返回学号到隐私级别的映射，没有设置的学生为默认级别"""
+    student_ids = list(student_ids)
+    with pg_conn_context(read_only=True) as conn, conn.cursor() as cursor:
+        _select_levels.execute(cursor, (student_ids,))
+        levels = dict(cursor.fetchall())
+    default_level = get_config().DEFAULT_PRIVACY_LEVEL
+    return {student_id: levels.get(student_id, default_level) for student_id in student_ids}
+
+
 def set_level(student_id: str, new_level: int) -> None:
     with pg_conn_context() as conn, conn.cursor() as cursor:
-        insert_query = """
-        INSERT INTO privacy_settings (student_id, level, create_time) VALUES (%s,%s,%s)
-            ON CONFLICT (student_id) DO UPDATE SET level=EXCLUDED.level
-        """
-        cursor.execute(insert_query, (student_id, new_level, datetime.datetime.now()))
+        _upsert_level.execute(cursor, (student_id, new_level, datetime.datetime.now()))
         conn.commit()
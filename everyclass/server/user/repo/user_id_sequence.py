@@ -1,13 +1,37 @@
+import os
+import threading
+from collections import deque
+from typing import List
+
+from everyclass.server.utils.config import get_config
 from everyclass.server.utils.db import pg_conn_context
+from everyclass.server.utils.db.prepared import PreparedStatement
+
+_reserved_ids = deque()
+_reserved_pid = None
+_reserve_lock = threading.Lock()
+_reserve_block = PreparedStatement("user_id_reserve_block", "SELECT nextval('user_id_seq') FROM generate_series(1, %s)")
+
+
+def new() -> int:
+    """分配一个新的 user id。每个进程一次从序列中预留一批 id 并在本地依次分配，用完后再预留下一批"""
+    global _reserved_pid
+    with _reserve_lock:
+        if _reserved_pid != os.getpid():  # fork 出的 worker 不能沿用父进程预留的 id，否则会重复分配
+            _reserved_ids.clear()
+            _reserved_pid = os.getpid()
+        if not _reserved_ids:
+            _reserved_ids.extend(reserve_block(get_config().USER_ID_BLOCK_SIZE))
+        return _reserved_ids.popleft()
 
 
-def new():
+def reserve_block(size: int) -> List[int]:
+    """用一次查询从序列中取出 size 个 id。进程退出时没用完的 id 会被丢弃，user id 不保证连续"""
     with pg_conn_context() as conn, conn.cursor() as cursor:
-        get_sequence_query = """SELECT nextval('user_id_seq')"""
-        cursor.execute(get_sequence_query)
-        num = cursor.fetchone()[0]
+        _reserve_block.execute(cursor, (size,))
+        ids = [row[0] for row in cursor.fetchall()]
 
-    return num
+    return ids
 
 
 def init_table() -> None:
@@ -15,11 +15,17 @@ from everyclass.server.user.exceptions import RecordNotFound, NoPermissionToAcce
 from everyclass.server.user.model import User, VerificationRequest, SimplePassword, Visitor, Grant
 from everyclass.server.user.repo import privacy_settings, visit_count, user_id_sequence, visit_track
 from everyclass.server.utils.base_exceptions import InternalError
+from everyclass.server.utils.circuit_breaker import UPSTREAM_AUTH, get_breaker
 from everyclass.server.utils.session import USER_TYPE_TEACHER, USER_TYPE_STUDENT
+from everyclass.server.utils.web_consts import SESSION_USER_SEQ
 
 """Registration and Login"""
 
 
+def auth_breaker():
+    return get_breaker(UPSTREAM_AUTH)
+
+
 def add_user(identifier: str, password: str, password_encrypted: bool = False) -> None:
     return User.add_user(identifier, password, password_encrypted)
 
@@ -47,7 +53,7 @@ def register_by_email(identifier: str) -> str:
     request_id = VerificationRequest.new_email_request(identifier)
 
     with tracer.trace('send_email'):
-        rpc_result = Auth.register_by_email(request_id, identifier)
+        rpc_result = auth_breaker().call(Auth.register_by_email, request_id, identifier)
 
     if rpc_result['acknowledged'] is False:
         raise InternalError("Unexpected acknowledge status")
@@ -58,7 +64,7 @@ def register_by_email(identifier: str) -> str:
 def register_by_email_token_check(token: str) -> str:
     """检查邮件验证token有效性，并返回verification requestID"""
     with tracer.trace('verify_email_token'):
-        rpc_result = Auth.verify_email_token(token=token)
+        rpc_result = auth_breaker().call(Auth.verify_email_token, token=token)
 
     if not rpc_result.success:
         raise InvalidTokenError
@@ -110,7 +116,7 @@ def register_by_password(jw_password: str, password: str, identifier: str) -> st
     request_id = VerificationRequest.new_password_request(identifier, password)
     # call everyclass-auth to verify password
     with tracer.trace('register_by_password'):
-        rpc_result = Auth.register_by_password(request_id=str(request_id),
+        rpc_result = auth_breaker().call(Auth.register_by_password, request_id=str(request_id),
                                                student_id=identifier,
                                                password=jw_password)
 
@@ -141,7 +147,7 @@ def register_by_password_status_refresh(request_id: str) -> Tuple[bool, str, Opt
 
     # fetch status from everyclass-auth
     with tracer.trace('get_result'):
-        rpc_result = Auth.get_result(str(request_id))
+        rpc_result = auth_breaker().call(Auth.get_result, str(request_id))
 
     if rpc_result.success:  # 密码验证通过，设置请求状态并新增用户
         verification_req = VerificationRequest.find_by_id(uuid.UUID(request_id))
@@ -204,6 +210,26 @@ def has_access(host: str, visitor: Optional[str] = None, footprint: bool = True)
     return True, None
 
 
+def has_access_batch(hosts: List[str], visitor: Optional[str] = None) -> Dict[str, Tuple[bool, Optional[str]]]:
+    """批量检查访问者是否有权限访问多个学生或老师，结果与 footprint 为 False 时的 has_access 相同。授权和隐私级别各只查询一次"""
+    granted = Grant.granted_users(visitor, hosts) if visitor and hosts else set()
+    levels = privacy_settings.get_levels(hosts + [visitor] if visitor else hosts) if hosts else {}
+
+    result = {}
+    for host in hosts:
+        if host in granted:
+            result[host] = (True, None)
+        elif levels[host] == 2 and visitor != host:
+            result[host] = (False, REASON_SELF_ONLY)
+        elif levels[host] == 1 and not visitor:
+            result[host] = (False, REASON_LOGIN_REQUIRED)
+        elif levels[host] == 1 and levels[visitor] == 2:
+            result[host] = (False, REASON_PERMISSION_ADJUST_REQUIRED)
+        else:
+            result[host] = (True, None)
+    return result
+
+
 """granting"""
 
 
@@ -276,10 +302,10 @@ def get_visitors(identifier: str) -> List[Visitor]:
 
 
 def get_user_id() -> int:
-    """user id 是APM系统中的用户标识，为递增数字，不是学号。如果session中保存了就使用session中的，否则新生成一个。"""
-    if session.get('user_id', None):
-        return session.get('user_id', None)
-    return user_id_sequence.new()
+    """user id 是APM系统中的用户标识，为递增数字，不是学号。如果session中保存了就使用session中的，否则新分配一个并保存到session中。"""
+    if not session.get(SESSION_USER_SEQ, None):
+        session[SESSION_USER_SEQ] = user_id_sequence.new()
+    return session[SESSION_USER_SEQ]
 
 
 """JWT Token"""
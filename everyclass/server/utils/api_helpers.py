@@ -5,7 +5,7 @@ import functools
 
 from flask import request, g
 
-from everyclass.server.utils.common_helpers import get_ut_uid, UTYPE_GUEST
+from everyclass.server.utils.common_helpers import get_logged_in_uid
 from everyclass.server.utils.jsonable import to_json_response
 
 # 请求错误
@@ -73,12 +73,9 @@ def login_required(func):
 
     @functools.wraps(func)
     def wrapped(*args, **kwargs):
-        try:
-            ut, uid = get_ut_uid()
-            if ut == UTYPE_GUEST:
-                return generate_error_response(None, STATUS_CODE_PERMISSION_DENIED, "您需要登录才能进行此操作")
-        except NotImplementedError:
-            return generate_error_response(None, STATUS_CODE_PERMISSION_DENIED, "检测身份时遇到未知错误")
+        uid = get_logged_in_uid()
+        if not uid:
+            return generate_error_response(None, STATUS_CODE_PERMISSION_DENIED, "您需要登录才能进行此操作")
 
         g.user_id = uid
         return func(*args, **kwargs)
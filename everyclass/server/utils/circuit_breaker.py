@@ -0,0 +1,228 @@
+"""
+上游服务的熔断、自适应超时与并发隔离
+
+每个上游（entity、auth）对应一个 `CircuitBreaker`，通过 `circuit_breaker(upstream)` 装饰器或 `get_breaker(upstream).call(...)` 使用：
+
+- 熔断：连续 CIRCUIT_BREAKER_FAILURE_THRESHOLD 次失败（服务端错误、超时、慢调用）后熔断（open），之后
+  CIRCUIT_BREAKER_RESET_TIMEOUT 秒内的调用直接失败；到时间后进入半开（half-open）状态放行一次试探调用，成功则恢复（closed），
+  失败则重新熔断；
+- 自适应超时：按最近成功调用耗时的 CIRCUIT_BREAKER_TIMEOUT_PERCENTILE 分位数乘以 CIRCUIT_BREAKER_TIMEOUT_MULTIPLIER 计算超时时间，
+  限制在 [CIRCUIT_BREAKER_MIN_TIMEOUT, CIRCUIT_BREAKER_MAX_TIMEOUT] 内。gevent 模式下超时的调用会被中断；线程模式下无法中断
+  RPC，超时的调用计为一次失败，使熔断器更早打开；
+- 并发隔离（bulkhead）：每个 worker 内同时访问同一个上游的请求数不超过 CIRCUIT_BREAKER_MAX_CONCURRENCY（默认为 worker 并发数的
+  一半，后台刷新缓存的线程也会占用名额），上游变慢时其余线程仍然可以处理不访问该上游的请求。上游正常时超出的请求最多等待
+  CIRCUIT_BREAKER_BULKHEAD_WAIT 秒；上游已经出现失败时直接失败，不会让所有线程都阻塞在异常的上游上。
+
+被拒绝的调用抛出 `UpstreamUnavailable`。statsd 指标带 `upstream:` tag：
+- circuit_breaker.state：0 closed，1 half-open，2 open
+- circuit_breaker.rejected：被拒绝的调用数，带 `reason:open|half_open|bulkhead|timeout` tag
+- circuit_breaker.timeout：当前的自适应超时时间（毫秒）
+"""
+import collections
+import functools
+import threading
+import time
+from typing import Dict
+
+from everyclass.rpc import RpcServerException, RpcServerNotAvailable, RpcTimeout
+from everyclass.server.utils.base_exceptions import InternalError
+from everyclass.server.utils.config import get_config
+from everyclass.server.utils.timing import PHASE_RPC, phase
+
+UPSTREAM_ENTITY = 'entity'
+UPSTREAM_AUTH = 'auth'
+
+STATE_CLOSED = 0
+STATE_HALF_OPEN = 1
+STATE_OPEN = 2
+
+_FAILURES = (RpcServerException, RpcServerNotAvailable, RpcTimeout)
+_MIN_SAMPLES = 20  # 样本太少时使用最大超时时间
+_RECALCULATE_EVERY = 10
+
+
+class UpstreamUnavailable(InternalError):
+    """上游服务熔断、并发已满或调用超时，请求没有被发出或已被中断"""
+
+    def __init__(self, upstream: str, reason: str):
+        super().__init__(f"upstream {upstream} is unavailable: {reason}")
+        self.upstream = upstream
+        self.reason = reason
+
+
+class CircuitBreaker:
+    def __init__(self, upstream: str):
+        config = get_config()
+        self.upstream = upstream
+        self.state = STATE_CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.timeout = config.CIRCUIT_BREAKER_MAX_TIMEOUT
+        self._latencies = collections.deque(maxlen=config.CIRCUIT_BREAKER_LATENCY_WINDOW)
+        self._samples_since_calculated = 0
+        self._trial_running = False
+        self._lock = threading.Lock()
+        self._bulkhead = threading.BoundedSemaphore(_max_concurrency())
+
+    def call(self, func, *args, **kwargs):
+        is_trial = self._before_call()
+        if not self._acquire_bulkhead():
+            if is_trial:
+                self._release_trial()
+            self._reject('bulkhead')
+        try:
+            start = time.monotonic()
+            try:
+                with phase(PHASE_RPC):
+                    result = self._call_with_timeout(func, *args, **kwargs)
+            except (*_FAILURES, UpstreamUnavailable):
+                self._on_failure()
+                raise
+            except Exception:
+                self._on_success(None)  # 客户端错误说明上游是正常的
+                raise
+            except BaseException:
+                # gevent.Timeout、GreenletExit 等中断了调用，无法判断上游是否正常。试探调用被中断时需要释放名额，否则会一直处于半开状态
+                if is_trial:
+                    self._release_trial()
+                raise
+            latency = time.monotonic() - start
+            if latency > self.timeout:
+                self._on_failure()  # 线程模式下无法中断的慢调用
+            else:
+                self._on_success(latency)
+            return result
+        finally:
+            self._bulkhead.release()
+
+    def _acquire_bulkhead(self) -> bool:
+        if self.state == STATE_CLOSED and self.failures == 0:
+            return self._bulkhead.acquire(timeout=get_config().CIRCUIT_BREAKER_BULKHEAD_WAIT)
+        return self._bulkhead.acquire(blocking=False)
+
+    def _call_with_timeout(self, func, *args, **kwargs):
+        if not _gevent_patched():
+            return func(*args, **kwargs)
+
+        import gevent
+        try:
+            with gevent.Timeout(self.timeout):
+                return func(*args, **kwargs)
+        except gevent.Timeout:
+            self._report_rejected('timeout')
+            raise UpstreamUnavailable(self.upstream, 'timeout')
+
+    def _before_call(self) -> bool:
+        """检查熔断状态，不允许调用时抛出 UpstreamUnavailable。返回本次调用是否为半开状态下的试探调用"""
+        with self._lock:
+            if self.state == STATE_OPEN:
+                if time.monotonic() - self.opened_at < get_config().CIRCUIT_BREAKER_RESET_TIMEOUT:
+                    reason = 'open'
+                else:
+                    self._set_state(STATE_HALF_OPEN)
+            if self.state == STATE_HALF_OPEN:
+                if self._trial_running:
+                    reason = 'half_open'
+                else:
+                    self._trial_running = True
+                    return True
+            if self.state == STATE_CLOSED:
+                return False
+        self._reject(reason)
+
+    def _on_success(self, latency) -> None:
+        with self._lock:
+            self.failures = 0
+            self._trial_running = False
+            if self.state != STATE_CLOSED:
+                self._set_state(STATE_CLOSED)
+            if latency is not None:
+                self._latencies.append(latency)
+                self._samples_since_calculated += 1
+                if self._samples_since_calculated >= _RECALCULATE_EVERY:
+                    self._recalculate_timeout()
+
+    def _on_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            self._trial_running = False
+            if self.state == STATE_HALF_OPEN or self.failures >= get_config().CIRCUIT_BREAKER_FAILURE_THRESHOLD:
+                self.opened_at = time.monotonic()
+                if self.state != STATE_OPEN:
+                    self._set_state(STATE_OPEN)
+
+    def _release_trial(self) -> None:
+        with self._lock:
+            self._trial_running = False
+
+    def _recalculate_timeout(self) -> None:
+        config = get_config()
+        self._samples_since_calculated = 0
+        if len(self._latencies) < _MIN_SAMPLES:
+            return
+        latencies = sorted(self._latencies)
+        percentile = latencies[min(len(latencies) - 1, len(latencies) * config.CIRCUIT_BREAKER_TIMEOUT_PERCENTILE // 100)]
+        self.timeout = min(max(percentile * config.CIRCUIT_BREAKER_TIMEOUT_MULTIPLIER, config.CIRCUIT_BREAKER_MIN_TIMEOUT),
+                           config.CIRCUIT_BREAKER_MAX_TIMEOUT)
+
+        from everyclass.server import statsd  # 需要在这里导入，否则导入的结果是None
+        if statsd:
+            statsd.gauge("circuit_breaker.timeout", self.timeout * 1000, tags=[f"upstream:{self.upstream}"])
+
+    def _set_state(self, state: int) -> None:
+        from everyclass.server import logger, statsd
+
+        logger.warning(f"Circuit breaker of {self.upstream} changed state from {self.state} to {state}")
+        self.state = state
+        if statsd:
+            statsd.gauge("circuit_breaker.state", state, tags=[f"upstream:{self.upstream}"])
+
+    def _reject(self, reason: str):
+        self._report_rejected(reason)
+        raise UpstreamUnavailable(self.upstream, reason)
+
+    def _report_rejected(self, reason: str) -> None:
+        from everyclass.server import statsd
+
+        if statsd:
+            statsd.increment("circuit_breaker.rejected", tags=[f"upstream:{self.upstream}", f"reason:{reason}"])
+
+
+def _max_concurrency() -> int:
+    from everyclass.server.utils.db.pool import worker_concurrency
+
+    return get_config().CIRCUIT_BREAKER_MAX_CONCURRENCY or max(1, worker_concurrency() // 2)
+
+
+def _gevent_patched() -> bool:
+    try:
+        from gevent import monkey
+    except ImportError:
+        return False
+    return monkey.is_module_patched('socket')
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(upstream: str) -> CircuitBreaker:
+    """获得上游对应的熔断器。熔断器在第一次使用时创建（fork 之后），每个 worker 独立统计"""
+    if upstream not in _breakers:
+        with _breakers_lock:
+            if upstream not in _breakers:
+                _breakers[upstream] = CircuitBreaker(upstream)
+    return _breakers[upstream]
+
+
+def circuit_breaker(upstream: str):
+    """通过上游对应的熔断器调用被装饰的函数"""
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapped(*args, **kwargs):
+            return get_breaker(upstream).call(func, *args, **kwargs)
+
+        return wrapped
+
+    return decorator
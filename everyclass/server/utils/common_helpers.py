@@ -24,18 +24,18 @@ UTYPE_GUEST = "guest"
 
 
 def get_ut_uid():
-    """已登录用户获得学号，未登录用户获得user序列ID"""
+    """已登录用户获得学号，未登录用户获得user序列ID（没有时才分配）"""
     if SESSION_CURRENT_USER in session:
         return UTYPE_USER, session[SESSION_CURRENT_USER].identifier
     if SESSION_USER_SEQ in session:
         return UTYPE_GUEST, session[SESSION_USER_SEQ]
-    raise NotImplementedError("user seq not exist in session")
+
+    from everyclass.server.user import service as user_service
+    return UTYPE_GUEST, user_service.get_user_id()
 
 
 def get_logged_in_uid():
-    """获得当前已登录的用户ID，如果未登录返回None"""
-    ut, uid = get_ut_uid()
-    if ut == UTYPE_GUEST:
-        return None
-    else:
-        return uid
+    """获得当前已登录的用户ID，如果未登录返回None。不会为未登录用户分配user序列ID"""
+    if SESSION_CURRENT_USER in session:
+        return session[SESSION_CURRENT_USER].identifier
+    return None
@@ -1,3 +1,4 @@
+import contextlib
 import os
 
 from everyclass.server.utils.config.default import Config as DefaultConfig
@@ -69,5 +70,23 @@ def get_config():
                     print("{} must be overwritten in production environment. Exit.".format(each_key))
                     exit(1)
 
+        type.__setattr__(MixedConfig, '_frozen', True)
         _config_inited = True
         return MixedConfig
+
+
+@contextlib.contextmanager
+def override_config(**values):
+    """临时修改已冻结的配置，退出时恢复原值。仅用于测试和基准测试"""
+    config = get_config()
+    old_values = {key: config.__dict__[key] for key in values if key in config.__dict__}
+    for key, value in values.items():
+        type.__setattr__(config, key, value)
+    try:
+        yield config
+    finally:
+        for key in values:
+            if key in old_values:
+                type.__setattr__(config, key, old_values[key])
+            else:
+                type.__delattr__(config, key)
@@ -1,17 +1,38 @@
-from flask import current_app, has_app_context
+import os
+import threading
+
 from pymongo import MongoClient, database
 
 from everyclass.server.utils.config import get_config
+from everyclass.server.utils.db.pool import MongoPoolListener, max_connections
+
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+
+
+def init_pool() -> None:
+    """丢弃从 master 进程继承的客户端，下次获取连接时在当前进程中重新创建。仅在fork后运行一次"""
+    global _client, _client_pid
+    with _client_lock:
+        _client, _client_pid = None, None
 
 
-def init_pool(current_application) -> None:
-    """创建连接池，保存在 app 的 mongo 属性中"""
-    current_application.mongo = MongoClient(**current_application.config['MONGODB'])
+def _get_client() -> MongoClient:
+    """每个进程共用一个 MongoClient（自带连接池），第一次使用时创建"""
+    global _client, _client_pid
+    with _client_lock:
+        if _client is None or _client_pid != os.getpid():
+            config = get_config()
+            _client = MongoClient(**config.MONGODB,
+                                  maxPoolSize=max_connections(),
+                                  waitQueueTimeoutMS=config.DB_POOL_TIMEOUT * 1000,
+                                  event_listeners=[MongoPoolListener()],
+                                  connect=False)
+            _client_pid = os.getpid()
+        return _client
 
 
 def get_connection() -> database.Database:
     """在连接池中获得连接"""
-    if not has_app_context():
-        config = get_config()
-        return MongoClient(**config.MONGODB).get_database(config.MONGODB_DB)
-    return current_app.mongo.get_database(current_app.config['MONGODB_DB'])
+    return _get_client().get_database(get_config().MONGODB_DB)
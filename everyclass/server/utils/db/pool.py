@@ -0,0 +1,150 @@
+"""
+连接池
+
+Postgres、Redis、MongoDB 的连接池统一在这里定义：
+- 每个 worker 的常驻连接数默认等于 uWSGI 线程数（gevent 模式下为协程数，但不超过 DB_POOL_SIZE_LIMIT；DB_POOL_SIZE 可覆盖），
+  高峰时最多再多建 DB_POOL_MAX_OVERFLOW 个连接，等待空闲连接超过 DB_POOL_TIMEOUT 秒报错；
+- Postgres 只有一个连接池，ORM（db_session）和原生游标（pg_conn_context）共用；
+- fork 之后在每个 worker 中调用 `init_pools` 重新初始化，不使用从 master 继承来的连接。
+
+借出连接时上报 statsd 指标，带 `pool:postgres|postgres_replica|redis|mongodb` tag：
+- db.pool.checkout：借出次数
+- db.pool.wait：等待空闲连接的时间（毫秒）
+- db.pool.in_use：已借出的连接数
+- db.pool.overflow：超出常驻连接数的连接数
+"""
+import threading
+import time
+
+from pymongo import monitoring
+from redis import BlockingConnectionPool
+from sqlalchemy.pool import QueuePool
+
+from everyclass.server.utils import timing
+from everyclass.server.utils.config import get_config
+
+POOL_POSTGRES = 'postgres'
+POOL_POSTGRES_REPLICA = 'postgres_replica'
+POOL_REDIS = 'redis'
+POOL_MONGODB = 'mongodb'
+
+
+def worker_concurrency() -> int:
+    """当前 uWSGI worker 能同时处理的请求数：线程数，gevent 模式下为协程数。不在 uWSGI 中运行时为 1"""
+    try:
+        import uwsgi
+        return int(uwsgi.opt.get('gevent', 0)) or int(uwsgi.opt.get('threads', 1))
+    except (ModuleNotFoundError, ValueError):
+        return 1
+
+
+def pool_size() -> int:
+    """常驻连接数。gevent 模式下协程数很多，连接数不超过 DB_POOL_SIZE_LIMIT，其余请求排队等待空闲连接"""
+    config = get_config()
+    return config.DB_POOL_SIZE or min(worker_concurrency(), config.DB_POOL_SIZE_LIMIT)
+
+
+def max_connections() -> int:
+    return pool_size() + get_config().DB_POOL_MAX_OVERFLOW
+
+
+def report_checkout(pool_name: str, wait_seconds: float, in_use: int, overflow: int = 0) -> None:
+    from everyclass.server import statsd  # 需要在这里导入，否则导入的结果是None
+
+    if statsd is None:
+        return
+    tags = [f"pool:{pool_name}"]
+    statsd.increment("db.pool.checkout", tags=tags)
+    statsd.timing("db.pool.wait", wait_seconds * 1000, tags=tags)
+    statsd.gauge("db.pool.in_use", in_use, tags=tags)
+    statsd.gauge("db.pool.overflow", overflow, tags=tags)
+
+
+class MeteredQueuePool(QueuePool):
+    """上报指标的 SQLAlchemy 连接池"""
+    pool_name = POOL_POSTGRES
+
+    def _do_get(self):
+        start = time.perf_counter()
+        conn = super()._do_get()
+        report_checkout(self.pool_name, time.perf_counter() - start, self.checkedout(), max(self.overflow(), 0))
+        return conn
+
+
+class MeteredReplicaQueuePool(MeteredQueuePool):
+    pool_name = POOL_POSTGRES_REPLICA
+
+
+class MeteredBlockingConnectionPool(BlockingConnectionPool):
+    """上报指标的 Redis 连接池。连接数达到上限后等待空闲连接，而不是无限制地新建连接"""
+
+    def get_connection(self, command_name, *keys, **options):
+        start = time.perf_counter()
+        connection = super().get_connection(command_name, *keys, **options)
+        in_use = self.max_connections - self.pool.qsize()
+        report_checkout(POOL_REDIS, time.perf_counter() - start, in_use, max(in_use - pool_size(), 0))
+        connection.checked_out_at = start
+        return connection
+
+    def release(self, connection):
+        # 从借出到归还的时间计入请求的 redis 阶段（包括等待空闲连接的时间）
+        checked_out_at = getattr(connection, 'checked_out_at', None)
+        if checked_out_at is not None:
+            timing.record(timing.PHASE_REDIS, time.perf_counter() - checked_out_at)
+            connection.checked_out_at = None
+        super().release(connection)
+
+
+class MongoPoolListener(monitoring.ConnectionPoolListener):
+    """通过 pymongo 的连接池事件上报指标"""
+
+    def __init__(self):
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.in_use = 0
+
+    def connection_check_out_started(self, event):
+        self._local.start = time.perf_counter()
+
+    def connection_checked_out(self, event):
+        with self._lock:
+            self.in_use += 1
+            in_use = self.in_use
+        wait = time.perf_counter() - getattr(self._local, 'start', time.perf_counter())
+        report_checkout(POOL_MONGODB, wait, in_use, max(in_use - pool_size(), 0))
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.in_use -= 1
+
+    def pool_created(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        pass
+
+    def connection_check_out_failed(self, event):
+        pass
+
+
+def init_pools() -> None:
+    """fork 之后在每个 worker 中调用，丢弃从 master 继承的连接"""
+    from everyclass.server.utils.db.postgres import init_pool as init_pg
+    from everyclass.server.utils.db.redis import init_pool as init_redis
+    from everyclass.server.utils.db.mongodb import init_pool as init_mongo
+
+    init_pg()
+    init_redis()
+    init_mongo()
@@ -1,17 +1,52 @@
+"""
+Postgres 连接
+
+主库连接由 ORM（db_session）和原生游标（pg_conn_context）共用同一个连接池。配置了 POSTGRES_REPLICA_CONNECTION 时，显式声明为只读的
+操作（`pg_conn_context(read_only=True)`、`read_session()`）会被路由到只读副本：
+- 当前请求中已经在主库上提交过写操作时，之后的只读操作仍然走主库，保证读到自己刚写入的数据；
+- 副本连接失败时，在 POSTGRES_REPLICA_RETRY_INTERVAL 秒内都回退到主库。
+"""
+import logging
+import time
 from contextlib import contextmanager
 
-from sqlalchemy import create_engine
+import psycopg2.extras
+from flask import g, has_app_context
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE
+from sqlalchemy import create_engine, event
+from sqlalchemy.exc import OperationalError
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, scoped_session
 
+from everyclass.server.utils import timing
 from everyclass.server.utils.config import get_config
+from everyclass.server.utils.db.pool import MeteredQueuePool, MeteredReplicaQueuePool, pool_size
+
+logger = logging.getLogger(__name__)
 
 _config = get_config()
-_conn_config = _config.POSTGRES_CONNECTION
-_engine = create_engine(
-    f'postgresql+psycopg2://{_conn_config["user"]}:{_conn_config["password"]}@{_conn_config["host"]}:{_conn_config["port"]}/{_conn_config["dbname"]}',
-    connect_args={'options': f'-c search_path={_config.POSTGRES_SCHEMA}'})  # set echo=True to show logs
-db_session = scoped_session(sessionmaker(bind=_engine))
+
+
+def _create_engine(conn_config: dict, poolclass):
+    return create_engine(
+        f'postgresql+psycopg2://{conn_config["user"]}:{conn_config["password"]}@{conn_config["host"]}:{conn_config["port"]}/{conn_config["dbname"]}',
+        connect_args={'options': f'-c search_path={_config.POSTGRES_SCHEMA}'},
+        poolclass=poolclass,
+        pool_size=pool_size(),
+        max_overflow=_config.DB_POOL_MAX_OVERFLOW,
+        pool_timeout=_config.DB_POOL_TIMEOUT,
+        pool_pre_ping=True)  # set echo=True to show logs
+
+
+_engine = _create_engine(_config.POSTGRES_CONNECTION, MeteredQueuePool)
+_replica_engine = _create_engine(_config.POSTGRES_REPLICA_CONNECTION, MeteredReplicaQueuePool) \
+    if _config.POSTGRES_REPLICA_CONNECTION else None
+_replica_unhealthy_until = 0.0
+psycopg2.extras.register_uuid()  # 原生游标可以直接使用 uuid.UUID 类型的参数
+
+_session_factory = sessionmaker(bind=_engine)
+db_session = scoped_session(_session_factory)
+replica_session = scoped_session(sessionmaker(bind=_replica_engine or _engine))
 Base = declarative_base()
 
 
@@ -33,15 +68,85 @@ def create_table():
 
 
 def init_pool() -> None:
-    """创建连接池。仅在fork后运行一次，否则连接可能中断。"""
-    from everyclass.common.postgres import init_pool as init
-    init(_config.POSTGRES_SCHEMA, _config.POSTGRES_CONNECTION)
-
+    """丢弃从 master 进程继承的连接。仅在fork后运行一次，否则连接可能中断。"""
     _engine.dispose()
+    if _replica_engine:
+        _replica_engine.dispose()
+
+
+def _mark_primary_written() -> None:
+    """标记当前请求已经在主库上写入，之后的只读操作也走主库"""
+    if has_app_context():
+        g.pg_primary_written = True
+
+
+def _use_replica() -> bool:
+    if not _replica_engine or time.time() < _replica_unhealthy_until:
+        return False
+    return not (has_app_context() and g.get('pg_primary_written', False))
+
+
+def _mark_replica_unhealthy(e: Exception) -> None:
+    global _replica_unhealthy_until
+    _replica_unhealthy_until = time.time() + _config.POSTGRES_REPLICA_RETRY_INTERVAL
+    logger.warning(f"Postgres replica is unavailable, fall back to primary: {repr(e)}")
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info['query_start'] = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    timing.record(timing.PHASE_DB, time.perf_counter() - conn.info['query_start'])
+
+
+# ORM 查询的耗时计入请求的 db 阶段。原生游标不经过 engine，在 pg_conn_context 中统计
+if _config.PHASE_TIMING_ENABLED:
+    for _e in filter(None, (_engine, _replica_engine)):
+        event.listen(_e, "before_cursor_execute", _before_cursor_execute)
+        event.listen(_e, "after_cursor_execute", _after_cursor_execute)
+
+
+@event.listens_for(_session_factory, "after_commit")
+def _after_primary_commit(session):
+    _mark_primary_written()
+
+
+def read_session():
+    """获得用于只读查询的 ORM session。不要在返回的 session 上写入，也不要把查到的对象交给 db_session 修改"""
+    if _use_replica():
+        try:
+            replica_session.connection()  # 在这里借出连接，连接失败时可以回退到主库
+            return replica_session
+        except OperationalError as e:
+            replica_session.remove()
+            _mark_replica_unhealthy(e)
+    return db_session
 
 
 @contextmanager
-def pg_conn_context():
-    from everyclass.common.postgres import conn_context_with_retry as context
-    with context() as conn:
+def pg_conn_context(read_only: bool = False):
+    """
+    从连接池中借出一个 DBAPI 连接，退出时归还，未提交的事务会被回滚。主库连接池与 ORM 共用。
+
+    :param read_only: 只读操作，可能被路由到只读副本
+    """
+    conn = None
+    if read_only and _use_replica():
+        try:
+            conn = _replica_engine.raw_connection()
+        except OperationalError as e:
+            _mark_replica_unhealthy(e)
+    if conn is None:
+        conn = _engine.raw_connection()
+        read_only = False
+
+    start = time.perf_counter()
+    try:
         yield conn
+    finally:
+        timing.record(timing.PHASE_DB, time.perf_counter() - start)
+        # 主库连接上的事务已提交（连接空闲）说明发生了写入
+        if not read_only and conn.connection.get_transaction_status() == TRANSACTION_STATUS_IDLE:
+            _mark_primary_written()
+        conn.close()
@@ -0,0 +1,78 @@
+"""
+服务端预编译语句（PREPARE / EXECUTE）
+
+高频执行的 SQL 在模块中注册为 `PreparedStatement`，每条数据库连接第一次执行时 PREPARE 一次，之后以 EXECUTE 执行，
+省去 Postgres 每次解析 SQL 和生成执行计划的开销：
+
+    GET_LEVEL = PreparedStatement("privacy_get_level", "SELECT level FROM privacy_settings WHERE student_id=%s")
+
+    with pg_conn_context() as conn, conn.cursor() as cursor:
+        GET_LEVEL.execute(cursor, (student_id,))
+
+SQL 使用与 cursor.execute 相同的 %s 占位符，注册时转换为 $1、$2……。PREPARE 和 EXECUTE 都在保存点中执行：预编译失败，或者
+预编译过的语句已经不存在（经过事务级连接池中间件、执行过 DISCARD ALL 等）时，只回滚到保存点并回退为普通的文本 SQL 执行，
+不影响调用方在同一事务中已经执行的语句。出现过这两种情况的连接之后都直接执行文本 SQL。
+"""
+import logging
+import re
+import weakref
+from typing import Dict, Sequence
+
+import psycopg2
+from psycopg2 import errors
+
+logger = logging.getLogger(__name__)
+
+_registry: Dict[str, "PreparedStatement"] = {}
+# 每条 psycopg2 连接上已经 PREPARE 过的语句名，值为 None 表示这条连接不能使用预编译语句。连接被关闭回收后自动移除
+_prepared_on_connection = weakref.WeakKeyDictionary()
+
+_SAVEPOINT = "prepared_statement"
+
+
+class PreparedStatement:
+    def __init__(self, name: str, query: str):
+        if name in _registry:
+            raise ValueError(f"prepared statement {name} already registered")
+        self.name = name
+        self.query = query
+        self.param_count = query.count("%s")
+
+        counter = iter(range(1, self.param_count + 1))
+        self._prepare_query = f"PREPARE {name} AS {re.sub('%s', lambda _: f'${next(counter)}', query)}"
+        self._execute_query = f"EXECUTE {name}" + (f" ({','.join(['%s'] * self.param_count)})" if self.param_count else "")
+        _registry[name] = self
+
+    def execute(self, cursor, params: Sequence = ()) -> None:
+        """在 cursor 上执行语句，结果与 cursor.execute(self.query, params) 相同"""
+        conn = cursor.connection
+        prepared = _prepared_on_connection.setdefault(conn, set())
+        if prepared is None or (self.name not in prepared and not self._prepare(cursor, prepared)):
+            cursor.execute(self.query, params)
+            return
+
+        # 保存点和 EXECUTE 在一次往返中发送。保存点不单独释放（否则每次执行多一次往返），事务提交或回滚时一并释放；同名的保存点
+        # ROLLBACK TO 时回滚到最近的一个，即这次 EXECUTE 之前
+        try:
+            cursor.execute(f"SAVEPOINT {_SAVEPOINT}; {self._execute_query}", params)
+        except errors.InvalidSqlStatementName as e:
+            self._rollback(conn, e)
+            cursor.execute(self.query, params)
+
+    def _prepare(self, cursor, prepared: set) -> bool:
+        try:
+            cursor.execute(f"SAVEPOINT {_SAVEPOINT}; {self._prepare_query}")
+        except psycopg2.Error as e:
+            self._rollback(cursor.connection, e)
+            return False
+        cursor.execute(f"RELEASE SAVEPOINT {_SAVEPOINT}")
+        prepared.add(self.name)
+        return True
+
+    def _rollback(self, conn, e: Exception) -> None:
+        """回滚到保存点，并记录这条连接不能使用预编译语句"""
+        with conn.cursor() as control:
+            control.execute(f"ROLLBACK TO SAVEPOINT {_SAVEPOINT}")
+        _prepared_on_connection[conn] = None
+        logger.warning(f"prepared statement {self.name} is unavailable on this connection, fall back to plain SQL: "
+                       f"{repr(e)}")
@@ -1,8 +1,16 @@
 import redis
 
 from everyclass.server.utils.config import get_config
+from everyclass.server.utils.db.pool import MeteredBlockingConnectionPool, max_connections
 
 config = get_config()
-redis = redis.Redis(**config.REDIS)
+redis = redis.Redis(connection_pool=MeteredBlockingConnectionPool(max_connections=max_connections(),
+                                                                  timeout=config.DB_POOL_TIMEOUT,
+                                                                  **config.REDIS))
 
 redis_prefix = "ec_sv"
+
+
+def init_pool() -> None:
+    """断开从 master 进程继承的连接。仅在fork后运行一次"""
+    redis.connection_pool.reset()
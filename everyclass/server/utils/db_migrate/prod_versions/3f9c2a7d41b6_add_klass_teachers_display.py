@@ -0,0 +1,29 @@
+"""add klass teachers display
+
+Revision ID: 3f9c2a7d41b6
+Revises: 000b9794afd0
+Create Date: 2026-10-19 20:41:03.512406
+
+"""
+import sqlalchemy as sa
+from alembic import op
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = '3f9c2a7d41b6'
+down_revision = '000b9794afd0'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # 课程相关的表由 create_table 创建，没有对应的迁移，表不存在时跳过
+    if 'klass_meta' not in sa.inspect(op.get_bind()).get_table_names():
+        return
+    op.add_column('klass_meta', sa.Column('teachers_display', postgresql.JSONB(astext_type=sa.Text()), nullable=True))
+
+
+def downgrade():
+    if 'klass_meta' not in sa.inspect(op.get_bind()).get_table_names():
+        return
+    op.drop_column('klass_meta', 'teachers_display')
@@ -5,6 +5,12 @@ from typing import Dict
 from flask import Response
 
 from everyclass.common.env import is_production
+from everyclass.server.utils.timing import PHASE_SERIALIZE, phase
+
+try:
+    import orjson
+except ImportError:  # orjson 是可选依赖，未安装时回退到标准库 json
+    orjson = None
 
 
 class JSONSerializable:
@@ -36,8 +42,30 @@ def to_json(obj) -> str:
     return json.dumps(obj, cls=AdvancedJSONEncoder)
 
 
+def _orjson_default(obj):
+    if isinstance(obj, JSONSerializable):
+        return obj.__json_encode__()
+    if isinstance(obj, tuple):
+        return list(obj)  # orjson 只支持 tuple 本身，NamedTuple 等子类按标准库的行为输出为数组
+    raise TypeError(f"Object of type {obj.__class__.__name__} is not JSON serializable")
+
+
+# dataclass 模型的 __json_encode__ 会隐藏部分字段（如教室的原始 ID），所以不能让 orjson 直接按字段序列化 dataclass，
+# 统一交给 __json_encode__ 处理
+_ORJSON_OPTIONS = orjson.OPT_PASSTHROUGH_DATACLASS | orjson.OPT_NON_STR_KEYS if orjson else 0
+
+
+def to_json_bytes(obj) -> bytes:
+    """序列化为 UTF-8 编码的 JSON。安装了 orjson 时由 orjson 直接输出 bytes，否则使用 AdvancedJSONEncoder"""
+    if orjson:
+        return orjson.dumps(obj, default=_orjson_default, option=_ORJSON_OPTIONS)
+    return to_json(obj).encode('utf-8')
+
+
 def to_json_response(obj) -> Response:
-    resp = Response(to_json(obj), mimetype='application/json')
+    with phase(PHASE_SERIALIZE):
+        body = to_json_bytes(obj)
+    resp = Response(body, mimetype='application/json')
     resp.headers.add_header('Access-Control-Allow-Origin',
                             'https://everyclass.xyz' if is_production() else 'https://staging.everyclass.xyz')
     resp.headers.add_header('Access-Control-Allow-Credentials', 'true')
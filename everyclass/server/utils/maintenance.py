@@ -0,0 +1,51 @@
+"""
+维护模式开关
+
+维护状态保存在进程内存中，请求中检查维护模式只是一次模块属性读取（`maintenance.enabled`）。
+切换维护模式时写入或删除 MAINTENANCE_FILE（重启后保持状态），然后通过 uWSGI 信号通知所有 worker 重新读取该文件，
+不再需要 reload 整个 uWSGI。
+"""
+import os
+
+from everyclass.server.utils.config import get_config
+
+enabled = False
+
+
+def reload() -> None:
+    """从 MAINTENANCE_FILE 重新读取维护状态"""
+    global enabled
+    enabled = os.path.exists(get_config().MAINTENANCE_FILE)
+
+
+def switch(enable: bool) -> None:
+    """
+    进入或退出维护模式，并通知所有 worker
+
+    :raise FileNotFoundError: 退出维护模式时不在维护模式中
+    """
+    maintenance_file = get_config().MAINTENANCE_FILE
+    if enable:
+        open(maintenance_file, "w+").close()
+    else:
+        os.remove(maintenance_file)
+
+    reload()
+    if _signal_num is not None:
+        uwsgi.signal(_signal_num)
+
+
+try:
+    import uwsgi
+    import uwsgidecorators
+
+    # 本模块在 master 进程创建 app 时被导入，信号在 fork 之前注册，master 收到信号后转发给所有 worker
+    _signal_num = uwsgidecorators.get_free_signal()
+
+
+    @uwsgidecorators.signal(_signal_num, target='workers')
+    def _on_maintenance_signal(signum):
+        reload()
+
+except ModuleNotFoundError:
+    _signal_num = None
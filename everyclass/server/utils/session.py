@@ -1,13 +1,32 @@
 import _pickle
 import base64
+import binascii
+import os
 import pickle
+import secrets
+import time
+import uuid
 import zlib
-from typing import NamedTuple
+from typing import NamedTuple, Optional, Tuple
 
 from Crypto.Cipher import AES
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
 from flask.sessions import SessionInterface, SessionMixin
+from itsdangerous import BadSignature, Signer
 from werkzeug.datastructures import CallbackDict
 
+from everyclass.server.utils.timing import PHASE_SESSION, phase, timed
+from everyclass.server.utils.web_consts import SESSION_CURRENT_USER
+
+try:
+    import msgpack
+except ImportError:  # msgpack is optional, sessions fall back to pickle without it
+    msgpack = None
+
+SERIALIZER_PICKLE = 'pickle'
+SERIALIZER_MSGPACK = 'msgpack'
+
 
 # https://github.com/SaintFlipper/EncryptedSession/blob/master/main.py
 class EncryptedSession(CallbackDict, SessionMixin):
@@ -19,11 +38,131 @@ class EncryptedSession(CallbackDict, SessionMixin):
         self.modified = False
 
 
+# AttributeError and ModuleNotFoundError is due to migration of classes
+# it's acceptable to clean the user's whole session if there is error when unpickling, biz coders have to know this rule.
+SESSION_DECODE_ERRORS = (ValueError, TypeError, binascii.Error, zlib.error, InvalidTag, _pickle.UnpicklingError,
+                         pickle.UnpicklingError, AttributeError, ModuleNotFoundError)
+
+_EXT_USER_SESSION = 1
+_EXT_STUDENT_SESSION = 2
+_EXT_UUID = 3
+
+
+def serialize_session(session_dict: dict, serializer: str = SERIALIZER_MSGPACK) -> Tuple[str, bytes]:
+    """Serialize a session dict, return the serializer flag ("m" for msgpack, "p" for pickle) and the bytes"""
+    if serializer == SERIALIZER_MSGPACK and msgpack:
+        try:
+            return "m", msgpack.packb(session_dict, default=_msgpack_default, strict_types=True, use_bin_type=True)
+        except (TypeError, ValueError):
+            pass  # some value is not supported by msgpack, use pickle for this session
+    return "p", pickle.dumps(session_dict, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def deserialize_session(flag: str, data: bytes) -> dict:
+    if flag == "m":
+        if not msgpack:
+            raise ValueError("msgpack is not installed")
+        return msgpack.unpackb(data, ext_hook=_msgpack_ext_hook, raw=False, strict_map_key=False)
+    if flag == "p":
+        return pickle.loads(data)
+    raise ValueError(f"unknown session serializer flag {flag}")
+
+
+def _msgpack_default(obj):
+    # with strict_types, named tuples and tuples are passed here instead of being packed as arrays
+    if isinstance(obj, UserSession):
+        return msgpack.ExtType(_EXT_USER_SESSION, msgpack.packb(list(obj), use_bin_type=True))
+    if isinstance(obj, StudentSession):
+        return msgpack.ExtType(_EXT_STUDENT_SESSION, msgpack.packb(list(obj), use_bin_type=True))
+    if isinstance(obj, uuid.UUID):
+        return msgpack.ExtType(_EXT_UUID, obj.bytes)
+    if isinstance(obj, tuple):
+        return list(obj)
+    raise TypeError(f"Object of type {obj.__class__.__name__} is not supported by msgpack session serializer")
+
+
+def _msgpack_ext_hook(code: int, data: bytes):
+    if code == _EXT_USER_SESSION:
+        return UserSession(*msgpack.unpackb(data, raw=False))
+    if code == _EXT_STUDENT_SESSION:
+        return StudentSession(*msgpack.unpackb(data, raw=False))
+    if code == _EXT_UUID:
+        return uuid.UUID(bytes=data)
+    return msgpack.ExtType(code, data)
+
+
+class SessionCodec:
+    """
+    Serialize, compress and encrypt session dicts to cookie values, and the reverse.
+
+    Cookie formats:
+    - version 1 (legacy, read-only): <u|z>.<base64 cipher text>.<base64 mac>.<base64 nonce>, pickled and encrypted with
+      AES-EAX. "z" means compressed. Cookies in this format are still accepted so that users keep their sessions, and
+      are rewritten in version 2 the next time the session is modified.
+    - version 2: 2<p|m>[z].<urlsafe base64 of nonce + cipher text + tag>, encrypted with AES-GCM. "p" means pickle and
+      "m" means msgpack, "z" means compressed.
+
+    The AES-GCM cipher is constructed once from the key, so encrypting a cookie does not redo the key setup.
+    """
+    compress_threshold = 1024
+    nonce_size = 12
+
+    def __init__(self, crypto_key: bytes, serializer: str = SERIALIZER_MSGPACK):
+        self.crypto_key = crypto_key
+        self.aead = AESGCM(crypto_key)
+        self.serializer = serializer
+
+    @timed(PHASE_SESSION)
+    def encode(self, session_dict: dict) -> str:
+        flag, data = serialize_session(session_dict, self.serializer)
+        if len(data) > self.compress_threshold:
+            flag += "z"
+            data = zlib.compress(data)
+
+        nonce = os.urandom(self.nonce_size)
+        payload = base64.urlsafe_b64encode(nonce + self.aead.encrypt(nonce, data, None)).decode()
+        return f"2{flag}.{payload}"
+
+    @timed(PHASE_SESSION)
+    def decode(self, cookie: str) -> Optional[dict]:
+        """Return the session dict stored in the cookie, or None if the cookie is invalid"""
+        parts = cookie.split(".")
+        try:
+            if len(parts) == 2 and parts[0][:1] == "2":
+                return self._decode_v2(parts[0][1:], parts[1])
+            if len(parts) == 4:
+                return self._decode_v1(*parts)
+        except SESSION_DECODE_ERRORS:
+            return None
+        return None
+
+    def _decode_v2(self, flag: str, payload: str) -> dict:
+        raw = base64.urlsafe_b64decode(payload)
+        data = self.aead.decrypt(raw[:self.nonce_size], raw[self.nonce_size:], None)
+        if flag.endswith("z"):
+            data = zlib.decompress(data)
+            flag = flag[:-1]
+        return deserialize_session(flag, data)
+
+    def _decode_v1(self, prefix: str, b64_ciphertext: str, b64_mac: str, b64_nonce: str) -> dict:
+        ciphertext = base64.b64decode(b64_ciphertext)
+        mac = base64.b64decode(b64_mac)
+        nonce = base64.b64decode(b64_nonce)
+
+        cipher = AES.new(self.crypto_key, AES.MODE_EAX, nonce)
+        data = cipher.decrypt_and_verify(ciphertext, mac)
+        if prefix == 'z':
+            data = zlib.decompress(data)
+        return pickle.loads(data)
+
+
 class EncryptedSessionInterface(SessionInterface):
     session_class = EncryptedSession
-    compress_threshold = 1024
     session_cookie_name = "e_session"  # use special cookie name to avoid historical compatibility issues
 
+    def __init__(self, crypto_key: bytes, serializer: str = SERIALIZER_MSGPACK):
+        self.codec = SessionCodec(crypto_key, serializer)
+
     def open_session(self, app, request):
         """
         @param app: Flask app
@@ -31,48 +170,14 @@ class EncryptedSessionInterface(SessionInterface):
         @summary: Sets the current session from the request's session cooke. This overrides the default
         Flask implementation, adding AES decryption of the client-side session cookie.
         """
-
-        # Get the session cookie
         session_cookie = request.cookies.get(self.session_cookie_name)
         if not session_cookie:
             return self.session_class()
 
-        # Get the crypto key
-        crypto_key = app.config['SESSION_CRYPTO_KEY'] if 'SESSION_CRYPTO_KEY' in app.config else app.crypto_key
-
-        # Split the session cookie : <z|u>.<base64 cipher text>.<base64 mac>.<base64 nonce>
-        itup = session_cookie.split(".")
-        if len(itup) != 4:
-            return self.session_class()  # Session cookie not in the right format
-
-        try:
-
-            # Compressed data?
-            if itup[0] == 'z':  # session cookie for compressed data starts with "z."
-                is_compressed = True
-            else:
-                is_compressed = False
-
-            # Decode the cookie parts from base64
-            ciphertext = base64.b64decode(bytes(itup[1], 'utf-8'))
-            mac = base64.b64decode(bytes(itup[2], 'utf-8'))
-            nonce = base64.b64decode(bytes(itup[3], 'utf-8'))
-
-            # Decrypt
-            cipher = AES.new(crypto_key, AES.MODE_EAX, nonce)
-            data = cipher.decrypt_and_verify(ciphertext, mac)
-
-            # Convert back to a dict and pass that onto the session
-            if is_compressed:
-                data = zlib.decompress(data)
-            session_dict = pickle.loads(data)
-
-            return self.session_class(session_dict)
-
-        except (ValueError, _pickle.UnpicklingError, pickle.UnpicklingError, AttributeError, ModuleNotFoundError):
-            # AttributeError and ModuleNotFoundError is due to migration of classes
-            # it's acceptable to clean the user's whole session if there is error when unpickling, biz coders have to know this rule.
+        session_dict = self.codec.decode(session_cookie)
+        if session_dict is None:
             return self.session_class()
+        return self.session_class(session_dict)
 
     def save_session(self, app, session, response):
         """
@@ -80,47 +185,166 @@ class EncryptedSessionInterface(SessionInterface):
         @param session: Flask / Werkzeug Session
         @param response: Flask HTTP Response
         @summary: Saves the current session. This overrides the default Flask implementation, adding
-        AES encryption of the client-side session cookie.
+        AES encryption of the client-side session cookie. Unmodified sessions are not encrypted and sent again.
         """
-
         domain = self.get_cookie_domain(app)
         if not session:
             if session.modified:
-                response.delete_cookie(app.session_cookie_name, domain=domain)
+                response.delete_cookie(self.session_cookie_name, domain=domain)
             return
-        expires = self.get_expiration_time(app, session)
-
-        # Decide whether to compress
-        bdict = pickle.dumps(dict(session))
-        if len(bdict) > self.compress_threshold:
-            prefix = "z"  # session cookie for compressed data starts with "z."
-            bdict = zlib.compress(bdict)
-        else:
-            prefix = "u"  # session cookie for uncompressed data starts with "u."
-
-        # Get the crypto key
-        crypto_key = app.config['SESSION_CRYPTO_KEY'] if 'SESSION_CRYPTO_KEY' in app.config else app.crypto_key
-
-        # Encrypt using AES in EAX mode
-        cipher = AES.new(crypto_key, AES.MODE_EAX)
-        ciphertext, mac = cipher.encrypt_and_digest(bdict)
-        nonce = cipher.nonce
-
-        # Convert the ciphertext, mac, and nonce to base64
-        b64_ciphertext = base64.b64encode(ciphertext)
-        b64_mac = base64.b64encode(mac)
-        b64_nonce = base64.b64encode(nonce)
-
-        # Create the session cookie as <u|z>.<base64 cipher text>.<base64 mac>.<base64 nonce>
-        tup = [prefix, b64_ciphertext.decode(), b64_mac.decode(), b64_nonce.decode()]
-        session_cookie = ".".join(tup)
-
-        # Set the session cookie
-        response.set_cookie(self.session_cookie_name, session_cookie,
-                            expires=expires, httponly=True,
+
+        # the browser still holds the cookie of an unmodified session, there is no need to re-encrypt it
+        if not self.should_set_cookie(app, session):
+            return
+
+        response.set_cookie(self.session_cookie_name, self.codec.encode(dict(session)),
+                            expires=self.get_expiration_time(app, session), httponly=True,
                             domain=domain)
 
 
+
+class ServerSideSession(EncryptedSession):
+    """A session whose content is stored on server side, the cookie only carries the signed session id"""
+
+    def __init__(self, initial=None, sid: str = None, ttl: int = None, principal: tuple = None):
+        super().__init__(initial)
+        self.sid = sid
+        self.ttl = ttl  # remaining seconds to live when the session was loaded, None for new sessions
+        self.principal = principal  # values of the interface's `rotate_keys` when the session was loaded
+
+
+class RedisSessionStore:
+    """Session store backed by Redis. Loading a session reads the value and its TTL in one round trip."""
+
+    def __init__(self, redis_client, key_prefix: str):
+        self.redis = redis_client
+        self.key_prefix = key_prefix
+
+    def _key(self, sid: str) -> str:
+        return f"{self.key_prefix}:{sid}"
+
+    def load(self, sid: str) -> Tuple[Optional[bytes], Optional[int]]:
+        pipeline = self.redis.pipeline(transaction=False)
+        pipeline.get(self._key(sid))
+        pipeline.ttl(self._key(sid))
+        data, ttl = pipeline.execute()
+        return data, ttl
+
+    def save(self, sid: str, data: bytes, ttl: int) -> None:
+        self.redis.set(self._key(sid), data, ex=ttl)
+
+    def touch(self, sid: str, ttl: int) -> None:
+        self.redis.expire(self._key(sid), ttl)
+
+    def delete(self, sid: str) -> None:
+        self.redis.delete(self._key(sid))
+
+
+class LocalSessionStore:
+    """
+    In-process stand-in of `RedisSessionStore` for development and tests. Sessions are not shared between worker
+    processes and are lost when the process exits.
+    """
+
+    def __init__(self):
+        self._data = {}
+
+    def load(self, sid: str) -> Tuple[Optional[bytes], Optional[int]]:
+        data, expires_at = self._data.get(sid, (None, 0))
+        ttl = int(expires_at - time.time())
+        if data is None or ttl <= 0:
+            self._data.pop(sid, None)
+            return None, None
+        return data, ttl
+
+    def save(self, sid: str, data: bytes, ttl: int) -> None:
+        self._data[sid] = (data, time.time() + ttl)
+
+    def touch(self, sid: str, ttl: int) -> None:
+        if sid in self._data:
+            self._data[sid] = (self._data[sid][0], time.time() + ttl)
+
+    def delete(self, sid: str) -> None:
+        self._data.pop(sid, None)
+
+
+class ServerSideSessionInterface(SessionInterface):
+    """
+    Store session dicts in a `RedisSessionStore` (or `LocalSessionStore`) under a random id, the cookie only carries
+    the id signed with the app secret key.
+
+    - The session is written only when it is modified.
+    - The TTL of an unmodified session is extended only when less than `refresh_threshold` of its lifetime is left,
+      so most requests cost a single read.
+    - The cookie is sent whenever the TTL is extended (the session is written or touched), so it always expires
+      together with the stored session.
+    - A new session id is issued when any of `rotate_keys` changes (log in, log out or switch user), so an id
+      planted before login can not be used to take over the logged-in session.
+    """
+    session_class = ServerSideSession
+    session_cookie_name = "s_session"
+    sid_bytes = 24
+    refresh_threshold = 0.5
+    rotate_keys = (SESSION_CURRENT_USER,)
+
+    def __init__(self, store, secret_key: str, serializer: str = SERIALIZER_MSGPACK):
+        self.store = store
+        self.serializer = serializer
+        self.signer = Signer(secret_key, salt="everyclass-session")
+
+    def open_session(self, app, request):
+        signed_sid = request.cookies.get(self.session_cookie_name)
+        if not signed_sid:
+            return self.session_class()
+        try:
+            sid = self.signer.unsign(signed_sid).decode()
+        except BadSignature:
+            return self.session_class()
+
+        data, ttl = self.store.load(sid)
+        if not data:
+            return self.session_class()
+        try:
+            with phase(PHASE_SESSION):
+                session_dict = deserialize_session(data[:1].decode(), data[1:])
+        except SESSION_DECODE_ERRORS:
+            return self.session_class()
+        return self.session_class(session_dict, sid=sid, ttl=ttl, principal=self._principal(session_dict))
+
+    def _principal(self, session_dict) -> tuple:
+        return tuple(session_dict.get(key) for key in self.rotate_keys)
+
+    def save_session(self, app, session, response):
+        domain = self.get_cookie_domain(app)
+        lifetime = int(app.permanent_session_lifetime.total_seconds())
+
+        if not session:
+            if session.modified and session.sid:
+                self.store.delete(session.sid)
+                response.delete_cookie(self.session_cookie_name, domain=domain)
+            return
+
+        if not session.modified:
+            if session.sid and session.ttl is not None and session.ttl < lifetime * self.refresh_threshold:
+                self.store.touch(session.sid, lifetime)
+                self._set_cookie(response, session.sid, lifetime, domain)
+            return
+
+        with phase(PHASE_SESSION):
+            flag, data = serialize_session(dict(session), self.serializer)
+        if session.sid and session.principal != self._principal(session):
+            self.store.delete(session.sid)
+            session.sid = None
+        if not session.sid:
+            session.sid = secrets.token_urlsafe(self.sid_bytes)
+        self.store.save(session.sid, flag.encode() + data, lifetime)
+        self._set_cookie(response, session.sid, lifetime, domain)
+
+    def _set_cookie(self, response, sid: str, lifetime: int, domain):
+        response.set_cookie(self.session_cookie_name, self.signer.sign(sid).decode(),
+                            max_age=lifetime, httponly=True, domain=domain)
+
+
 class StudentSession(NamedTuple):
     """
     legacy session structure
@@ -0,0 +1,121 @@
+"""
+请求合并（single-flight）
+
+被 `single_flight` 装饰的函数，参数相同的并发调用只会真正执行一次，其余调用等待并共享这次执行的结果（或异常）。用于合并对上游服务的
+相同请求，例如一个班的同学同时打开同一个课表链接。只共享 Exception，执行的调用被 gevent.Timeout、GreenletExit 等 BaseException
+中断时，异常属于它自己的控制流，等待的调用各自重新发起调用。
+
+- 进程内：同一 worker 的多个线程（或 gevent 协程）共享一次调用；
+- 跨进程（SINGLE_FLIGHT_ACROSS_WORKERS）：在 Redis 中加一个短锁，持锁的 worker 执行调用并把结果短暂写入 Redis，其他 worker 轮询
+  读取结果；持锁的 worker 失败或超时时，其他 worker 自己发起调用。
+
+等待的调用最多等待 CIRCUIT_BREAKER_MAX_TIMEOUT 秒（上游调用的最长超时时间），超时后自己发起调用。
+
+共享的结果对象会被多个请求同时使用，调用方不能修改它。函数参数需要是可哈希的，并且 str() 后可以唯一标识这次调用。
+"""
+import functools
+import pickle
+import threading
+import time
+import uuid
+from typing import Dict, Hashable
+
+from everyclass.server.utils.config import get_config
+
+_RESULT_TTL_MS = 2000  # 跨进程共享的结果在 Redis 中保留的时间
+_POLL_INTERVAL = 0.02
+# 只有锁的值仍然是自己的 token 时才删除，避免锁过期后删掉其他 worker 重新获得的锁
+_RELEASE_LOCK_SCRIPT = "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('del', KEYS[1]) end return 0"
+
+
+class _Call:
+    __slots__ = ('done', 'result', 'exception', 'interrupted')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.exception = None
+        self.interrupted = False
+
+
+_calls: Dict[Hashable, _Call] = {}
+_calls_lock = threading.Lock()
+
+
+def single_flight(func):
+    name = f"{func.__module__}.{func.__qualname__}"
+
+    @functools.wraps(func)
+    def wrapped(*args, **kwargs):
+        params = args + tuple(sorted(kwargs.items()))
+        key = (name, params)
+        with _calls_lock:
+            call = _calls.get(key)
+            is_leader = call is None
+            if is_leader:
+                call = _calls[key] = _Call()
+
+        if not is_leader:
+            _report_shared(name)
+            if not call.done.wait(get_config().CIRCUIT_BREAKER_MAX_TIMEOUT) or call.interrupted:
+                return func(*args, **kwargs)
+            if call.exception is not None:
+                raise call.exception
+            return call.result
+
+        try:
+            if get_config().SINGLE_FLIGHT_ACROSS_WORKERS:
+                call.result = _call_across_workers(name, params, lambda: func(*args, **kwargs))
+            else:
+                call.result = func(*args, **kwargs)
+            return call.result
+        except Exception as e:
+            call.exception = e
+            raise
+        except BaseException:
+            call.interrupted = True  # 否则等待的调用会把 None 当作结果返回
+            raise
+        finally:
+            with _calls_lock:
+                del _calls[key]
+            call.done.set()
+
+    return wrapped
+
+
+def _call_across_workers(name: str, params: tuple, fetch):
+    from everyclass.server.utils.db.redis import redis, redis_prefix
+
+    key = f"{redis_prefix}:single_flight:{name}:{':'.join(map(str, params))}"
+    lock_ms = get_config().SINGLE_FLIGHT_LOCK_MS
+
+    token = uuid.uuid4().hex
+    if redis.set(f"{key}:lock", token, nx=True, px=lock_ms):
+        try:
+            result = fetch()
+            redis.set(f"{key}:result", pickle.dumps(result), px=_RESULT_TTL_MS)
+            return result
+        finally:
+            redis.eval(_RELEASE_LOCK_SCRIPT, 1, f"{key}:lock", token)
+
+    # 其他 worker 正在请求，等待其结果
+    _report_shared(name)
+    deadline = time.monotonic() + lock_ms / 1000
+    while time.monotonic() < deadline:
+        pipeline = redis.pipeline(transaction=False)
+        pipeline.get(f"{key}:result")
+        pipeline.exists(f"{key}:lock")
+        data, locked = pipeline.execute()
+        if data is not None:
+            return pickle.loads(data)
+        if not locked:
+            break  # 持锁的 worker 请求失败
+        time.sleep(_POLL_INTERVAL)
+    return fetch()
+
+
+def _report_shared(name: str) -> None:
+    from everyclass.server import statsd  # 需要在这里导入，否则导入的结果是None
+
+    if statsd:
+        statsd.increment("single_flight.shared", tags=[f"func:{name}"])
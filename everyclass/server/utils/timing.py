@@ -0,0 +1,109 @@
+"""
+请求各阶段耗时统计
+
+用 `phase(name)` 上下文管理器或 `timed(name)` 装饰器标记请求中的一个阶段，同一请求中同名阶段的耗时累加：
+
+    with phase(PHASE_RENDER):
+        html = render_template(...)
+
+请求结束时（见 create_app 中的钩子）：
+- 每个阶段的耗时作为 statsd 直方图 request.phase 上报（毫秒），带 `endpoint:`、`phase:` tag；
+- 非生产环境在响应中加入 Server-Timing 头，可以在浏览器开发者工具中直接查看。session 写入发生在响应头生成之后，只出现在
+  statsd 中。
+
+PHASE_TIMING_ENABLED 为 False 或不在请求上下文中（如后台线程）时，`phase` 返回共享的空上下文管理器，几乎没有开销。
+"""
+import functools
+import time
+from typing import Dict
+
+from flask import g, has_request_context
+
+PHASE_RPC = 'rpc'
+PHASE_DB = 'db'
+PHASE_REDIS = 'redis'
+PHASE_RENDER = 'render'
+PHASE_MINIFY = 'minify'
+PHASE_SESSION = 'session'
+PHASE_SERIALIZE = 'serialize'
+
+enabled = False  # 在 create_app 中按 PHASE_TIMING_ENABLED 设置
+
+
+class _NoopPhase:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        return False
+
+
+class _Phase:
+    __slots__ = ('name', 'start')
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        record(self.name, time.perf_counter() - self.start)
+        return False
+
+
+_NOOP = _NoopPhase()
+
+
+def phase(name: str):
+    """标记一个阶段。未启用或不在请求上下文中时返回空上下文管理器"""
+    if not enabled or not has_request_context():
+        return _NOOP
+    return _Phase(name)
+
+
+def timed(name: str):
+    """把被装饰函数的执行时间计入阶段 name"""
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapped(*args, **kwargs):
+            with phase(name):
+                return func(*args, **kwargs)
+
+        return wrapped
+
+    return decorator
+
+
+def record(name: str, seconds: float) -> None:
+    """把一段耗时计入当前请求的阶段 name，用于无法用上下文管理器包裹的场景（如连接借出到归还）"""
+    if not enabled or not has_request_context():
+        return
+    timings = g.setdefault('phase_timings', {})
+    timings[name] = timings.get(name, 0.0) + seconds
+
+
+def get_timings() -> Dict[str, float]:
+    """当前请求中各阶段的耗时（秒）"""
+    return g.get('phase_timings', {}) if has_request_context() else {}
+
+
+def server_timing_header(total: float) -> str:
+    """生成 Server-Timing 响应头，耗时单位为毫秒"""
+    metrics = [f"{name};dur={seconds * 1000:.2f}" for name, seconds in get_timings().items()]
+    metrics.append(f"total;dur={total * 1000:.2f}")
+    return ', '.join(metrics)
+
+
+def report(endpoint: str) -> None:
+    """把当前请求各阶段的耗时上报到 statsd"""
+    from everyclass.server import statsd  # 需要在这里导入，否则导入的结果是None
+
+    if statsd is None:
+        return
+    for name, seconds in get_timings().items():
+        statsd.histogram("request.phase", seconds * 1000, tags=[f"endpoint:{endpoint}", f"phase:{name}"])
@@ -0,0 +1,70 @@
+"""
+uWSGI worker 预热
+
+- `warm_up_master` 在 master 进程 fork 之前执行：编译所有模板、配置 ORM mapper。fork 之后这些对象由各个 worker 以写时复制的方式共享，
+  不需要每个 worker 在第一次请求时各自再做一遍。
+- `warm_up_worker` 在每个 worker fork 之后执行：预先建立 Postgres、Redis 连接，预取教室列表。uWSGI 在 postfork 钩子全部执行完之后
+  worker 才开始接受请求，因此 worker 预热完成后才会处理请求。
+
+预热失败只记录日志，不影响 worker 启动，对应的资源会在第一次使用时再初始化。
+"""
+import contextlib
+import time
+
+from flask import Flask
+
+from everyclass.server import logger
+
+
+def warm_up_master(app: Flask) -> None:
+    """fork 之前在 master 进程中执行"""
+    with _step("compile templates"):
+        count = 0
+        for template_name in app.jinja_env.list_templates():
+            app.jinja_env.get_template(template_name)
+            count += 1
+        logger.info(f"{count} templates compiled")
+
+    with _step("configure ORM mappers"):
+        from sqlalchemy.orm import configure_mappers
+        from everyclass.server.utils.db.postgres import register_model_to_base
+
+        register_model_to_base()
+        configure_mappers()
+
+
+def warm_up_worker(app: Flask) -> None:
+    """fork 之后在每个 worker 中执行，需要在初始化数据库连接池、获取远程 manifest 之后执行"""
+    with _step("open Postgres connections"):
+        from everyclass.server.utils.db.pool import pool_size
+        from everyclass.server.utils.db.postgres import db_session, pg_conn_context
+
+        # 同时借出与常驻连接数相同的连接，让连接池把连接都建好
+        with contextlib.ExitStack() as stack:
+            for _ in range(pool_size()):
+                conn = stack.enter_context(pg_conn_context())
+                with conn.cursor() as cursor:
+                    cursor.execute("SELECT 1")
+        db_session.execute("SELECT 1")
+        db_session.remove()
+
+    with _step("open Redis connection"):
+        from everyclass.server.utils.db.redis import redis
+
+        redis.ping()
+
+    with _step("prefetch rooms"), app.app_context():
+        from everyclass.server.entity import service as entity_service
+
+        entity_service.get_rooms()
+
+
+@contextlib.contextmanager
+def _step(name: str):
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception as e:  # 预热失败不应阻止 worker 启动
+        logger.warning(f"warm-up step '{name}' failed: {repr(e)}")
+    else:
+        logger.info(f"warm-up step '{name}' finished in {(time.perf_counter() - start) * 1000:.1f}ms")
@@ -31,6 +31,7 @@ MSG_TOKEN_INVALID = "令牌无效或已过期，请重新注册。"
 MSG_INVALID_IDENTIFIER = "无效的资源标识，请使用正常方法查询，不要拼接URL。"
 MSG_NOT_IN_COURSE = "您不是该门课程的学生，无法评价该门课程。"
 MSG_503 = "服务当前不可用，可能是程序员小哥哥正在更新数据哦，请稍后重试。"
+MSG_STALE_DATA = "数据服务暂时不可用，当前展示的是之前查询到的数据，可能不是最新的。"
 
 """
 flash
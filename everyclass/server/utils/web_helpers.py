@@ -9,7 +9,8 @@ from everyclass.rpc.entity import StudentTimetableResult
 from everyclass.server import sentry, logger
 from everyclass.server.user import service as user_service
 from everyclass.server.user.exceptions import AlreadyRegisteredError, InvalidTokenError
-from everyclass.server.utils.config import get_config
+from everyclass.server.utils import maintenance
+from everyclass.server.utils.circuit_breaker import UpstreamUnavailable
 from everyclass.server.utils.web_consts import MSG_400, SESSION_CURRENT_USER, MSG_NOT_LOGGED_IN
 
 
@@ -20,8 +21,7 @@ def disallow_in_maintenance(func):
 
     @functools.wraps(func)
     def wrapped(*args, **kwargs):
-        config = get_config()
-        if config.MAINTENANCE:
+        if maintenance.enabled:
             return render_template('maintenance.html')
         return func(*args, **kwargs)
 
@@ -80,6 +80,8 @@ def handle_exception_with_error_page(e: Exception) -> Text:
     if isinstance(e, InvalidTokenError):
         return _error_page(MSG_TOKEN_INVALID)
 
+    if isinstance(e, UpstreamUnavailable):
+        return _error_page(MSG_503, log=repr(e))  # 熔断或并发已满，上游故障已经由熔断器上报，不再逐个上报 sentry
     if isinstance(e, RpcTimeout):
         return _error_page(MSG_TIMEOUT, sentry_capture=True)
     elif isinstance(e, RpcResourceNotFound):
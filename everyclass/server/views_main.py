@@ -1,8 +1,8 @@
-import os
 import time
 
 from flask import Blueprint, Response, jsonify, render_template, request
 
+from everyclass.server.utils import maintenance
 from everyclass.server.utils.config import get_config
 
 main_blueprint = Blueprint('main', __name__)
@@ -58,8 +58,7 @@ def enter_maintenance():
     if auth \
             and auth.username in config.MAINTENANCE_CREDENTIALS \
             and config.MAINTENANCE_CREDENTIALS[auth.username] == auth.password:
-        open(config.MAINTENANCE_FILE, "w+").close()  # maintenance file
-        open(os.path.join(os.getcwd(), 'reload'), "w+").close()  # uwsgi reload
+        maintenance.switch(True)
         return 'success'
     else:
         return Response(
@@ -76,10 +75,9 @@ def exit_maintenance():
             and auth.username in config.MAINTENANCE_CREDENTIALS \
             and config.MAINTENANCE_CREDENTIALS[auth.username] == auth.password:
         try:
-            os.remove(config.MAINTENANCE_FILE)  # remove maintenance file
-        except OSError:
+            maintenance.switch(False)
+        except FileNotFoundError:
             return 'Not in maintenance mode. Ignore command.'
-        open(os.path.join(os.getcwd(), 'reload'), "w+").close()  # uwsgi reload
         return 'success'
     else:
         return Response(
@@ -4,6 +4,7 @@ import gc
 from ddtrace import patch_all, tracer
 
 from everyclass.server import create_app
+from everyclass.server.utils.warmup import warm_up_master
 
 patch_all()
 if os.environ.get("DD_AGENT_HOST", None) and os.environ.get("DD_TRACE_AGENT_PORT", None):
@@ -14,6 +15,9 @@ else:
 
 app = create_app()
 
+# fork 之前编译模板、配置 ORM mapper，与 app 一起被 gc.freeze，由 worker 写时复制共享
+warm_up_master(app)
+
 # disable gc and freeze
 gc.set_threshold(0)  # 700, 10, 10 as default
 gc.freeze()
@@ -0,0 +1,19 @@
+"""
+异步（gevent）服务入口
+
+/mobile/entity 和 /mobile/calendar 下的接口几乎全部时间都在等待 entity、auth 服务的 HTTP RPC。同步实例中每个 worker 最多同时处理
+threads 个请求，上游变慢时吞吐随之下降。这个入口在 gevent 协程中运行同一个 app：socket、requests、redis 客户端被 monkey patch
+为等待时切换协程，psycopg2 通过 psycogreen 在等待数据库时让出协程，每个 worker 可以同时处理上百个等待上游的请求。
+
+部署时与同步实例使用同一个镜像（UWSGI_ASYNC=1，见 deploy/docker-cmd.sh），由入口网关把 /mobile/entity 和 /mobile/calendar 转发到
+异步实例，其余路由仍由同步实例处理。
+"""
+from gevent import monkey
+
+monkey.patch_all()  # 必须在导入其他模块之前执行
+
+from psycogreen.gevent import patch_psycopg  # noqa: E402
+
+patch_psycopg()
+
+from server import app  # noqa: E402,F401
@@ -0,0 +1,23 @@
+"""
+性能基准测试
+
+基准测试不以 test 开头命名，不会被 nose 收集，需要单独运行。运行单个模块：
+$ python -m tests.benchmarks.bench_jsonable
+
+运行全部基准测试，把结果保存到 tests/benchmarks/results/ 并与上一次运行的结果对比：
+$ python -m tests.benchmarks
+
+基准测试只使用内存中构造的数据，不访问 Postgres、Redis 和上游服务。
+"""
+import timeit
+from typing import Dict
+
+results: Dict[str, float] = {}  # 本进程中所有 bench 调用的结果，名称 -> 单次耗时（微秒）
+
+
+def bench(name: str, func, number: int = 1000, repeat: int = 5) -> float:
+    """运行 func number 次并重复 repeat 轮，打印、记录并返回单次调用的最快耗时（微秒）"""
+    best = min(timeit.repeat(func, number=number, repeat=repeat)) / number * 1e6
+    print(f"{name:<60} {best:>12.2f} us")
+    results[name] = best
+    return best
@@ -0,0 +1,70 @@
+"""
+运行 tests/benchmarks 下的全部基准测试，结果保存到 tests/benchmarks/results/<时间>-<commit>.json，并与上一次的结果对比，
+耗时增加超过 --threshold 的项目标记为回归。
+
+$ python -m tests.benchmarks [--only session,encryption] [--threshold 10]
+"""
+import argparse
+import datetime
+import glob
+import importlib
+import json
+import os
+import pkgutil
+import subprocess
+
+from tests import benchmarks
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), 'results')
+
+
+def _commit() -> str:
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def _last_results():
+    files = sorted(glob.glob(os.path.join(RESULTS_DIR, '*.json')))
+    if not files:
+        return None, None
+    with open(files[-1]) as f:
+        return os.path.basename(files[-1]), json.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--only', help="只运行这些模块（去掉 bench_ 前缀，逗号分隔）")
+    parser.add_argument('--threshold', type=float, default=10, help="判定为回归的耗时增加百分比")
+    args = parser.parse_args()
+
+    modules = [name for _, name, _ in pkgutil.iter_modules(benchmarks.__path__) if name.startswith('bench_')]
+    if args.only:
+        modules = [name for name in modules if name[len('bench_'):] in args.only.split(',')]
+    for name in modules:
+        print(f"\n== {name}")
+        importlib.import_module(f"tests.benchmarks.{name}").main()
+
+    last_file, last = _last_results()
+    if last:
+        print(f"\nCompared with {last_file}:")
+        regressions = 0
+        for name, us in benchmarks.results.items():
+            if name not in last['results']:
+                continue
+            change = (us - last['results'][name]) / last['results'][name] * 100
+            regressed = change > args.threshold
+            regressions += regressed
+            print(f"{'REGRESSION' if regressed else '':<10} {name:<60} {change:>+8.1f}%")
+        print(f"{regressions} regression(s)")
+
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    filename = f"{datetime.datetime.now():%Y%m%d-%H%M%S}-{_commit()}.json"
+    with open(os.path.join(RESULTS_DIR, filename), 'w') as f:
+        json.dump({'commit': _commit(), 'results': benchmarks.results}, f, indent=2, ensure_ascii=False)
+    print(f"Results saved to {filename}")
+
+
+if __name__ == '__main__':
+    main()
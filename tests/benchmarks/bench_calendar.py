@@ -0,0 +1,43 @@
+"""
+ics 日历文件生成和学期日期计算的耗时
+
+$ python -m tests.benchmarks.bench_calendar
+"""
+import datetime
+import tempfile
+from collections import defaultdict
+from unittest import mock
+
+from tests.benchmarks import bench
+
+
+def make_cards(per_day: int):
+    """构造周一到周五每天 per_day 节、每节 16 周的课程，格式与 calendar/service.py 传给 ics_generator 的一致"""
+    cards = defaultdict(list)
+    for day in range(1, 6):
+        for time in range(1, per_day + 1):
+            cards[(day, time)].append(dict(name=f"课程{day}{time}", teacher="杨柳", week=list(range(1, 17)),
+                                           week_string="1-16/周", classroom="A座101", cid=f"encoded-card-{day}{time}"))
+    return cards
+
+
+def main():
+    from everyclass.server.calendar.domain import ics_generator
+    from everyclass.server.entity.domain import get_semester_date
+    from everyclass.server.entity.model import Semester
+
+    semester = Semester('2019-2020-1')
+    with tempfile.TemporaryDirectory() as directory, \
+            mock.patch.object(ics_generator, 'calendar_dir', lambda: directory), \
+            mock.patch('everyclass.server.statsd'):
+        for name, per_day in (("small", 2), ("large", 6)):
+            cards = make_cards(per_day)
+            bench(f"ics_generator.generate, {name} timetable ({per_day * 5} cards)",
+                  lambda: ics_generator.generate("张三", cards, semester, "bench.ics"), number=10)
+
+    date = datetime.date(2020, 3, 2)
+    bench("get_semester_date", lambda: get_semester_date(date), number=10000)
+
+
+if __name__ == '__main__':
+    main()
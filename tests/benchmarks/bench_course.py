@@ -0,0 +1,42 @@
+"""
+选修课推荐问卷（AnswerSheet.get_advice）在 5000 个教学班上的打分耗时
+
+$ python -m tests.benchmarks.bench_course
+"""
+import contextlib
+import io
+import random
+from types import SimpleNamespace
+from unittest import mock
+
+from tests.benchmarks import bench
+
+
+def make_classes(count: int):
+    """构造 count 个教学班，评分和分类随机，不访问数据库"""
+    from everyclass.server.course.model import CourseMeta
+
+    rng = random.Random(0)
+    return [SimpleNamespace(klass_id=i, rating_knowledge=rng.uniform(1, 5), rating_attendance=rng.uniform(1, 5),
+                            final_score=rng.uniform(60, 100), gender_rate=rng.uniform(0, 10),
+                            course=SimpleNamespace(main_category=rng.choice(CourseMeta.CATEGORIES)))
+            for i in range(count)]
+
+
+def main():
+    from everyclass.server.course.model import KlassMeta
+    from everyclass.server.course.model.questionnaire import Answer, AnswerSheet
+
+    classes = make_classes(5000)
+    sheet = AnswerSheet([Answer(0, [2]), Answer(1, [1]), Answer(2, [0, 3]), Answer(3, [1]), Answer(4, [0]), Answer(5, [2])])
+
+    def get_advice():
+        with contextlib.redirect_stdout(io.StringIO()):  # get_advice 中有调试输出
+            return sheet.get_advice()
+
+    with mock.patch.object(KlassMeta, 'get_all', lambda: classes):
+        bench("AnswerSheet.get_advice, 5000 classes", get_advice, number=10)
+
+
+if __name__ == '__main__':
+    main()
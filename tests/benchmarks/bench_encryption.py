@@ -0,0 +1,18 @@
+"""
+资源标识符加密、解密的耗时。每个课表页面的每节课都要加密课程和教室 ID
+
+$ python -m tests.benchmarks.bench_encryption
+"""
+from tests.benchmarks import bench
+
+
+def main():
+    from everyclass.server.utils.encryption import encrypt, decrypt
+
+    encrypted = encrypt('student', '3901160407')
+    bench("encrypt student id", lambda: encrypt('student', '3901160407'), number=5000)
+    bench("decrypt student id", lambda: decrypt(encrypted, resource_type='student'), number=5000)
+
+
+if __name__ == '__main__':
+    main()
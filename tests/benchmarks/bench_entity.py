@@ -0,0 +1,30 @@
+"""
+教室列表的构造与序列化、课表空列检查的耗时
+
+$ python -m tests.benchmarks.bench_entity
+"""
+from tests.benchmarks import bench
+
+
+def make_rooms_dict():
+    """构造与 entity 服务返回格式一致的教室列表：3 个校区、60 栋楼、3000 间教室"""
+    return {f"校区{c}": {f"教学楼{b}": {f"{c}{b:02}{r:03}": f"A{b}-{r}" for r in range(50)} for b in range(20)}
+            for c in range(3)}
+
+
+def main():
+    from everyclass.server.entity.model import AllRooms
+    from everyclass.server.entity.views import _empty_column_check
+    from everyclass.server.utils.jsonable import to_json
+
+    rooms_dict = make_rooms_dict()
+    all_rooms = AllRooms.make(rooms_dict)
+    bench("AllRooms.make, 3000 rooms", lambda: AllRooms.make(rooms_dict), number=5)
+    bench("AllRooms to_json, 3000 rooms", lambda: to_json(all_rooms), number=20)
+
+    cards = {(day, time): [] for day in range(1, 6) for time in range(1, 5)}
+    bench("_empty_column_check", lambda: _empty_column_check(cards), number=10000)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+"""
+对比 AdvancedJSONEncoder 与 orjson 后端在典型返回值上的序列化耗时
+
+$ python -m tests.benchmarks.bench_jsonable
+"""
+from tests.benchmarks import bench
+
+
+def make_all_rooms():
+    """构造约 3 个校区、60 栋楼、3000 间教室的全部教室列表，不调用加密函数"""
+    from everyclass.server.entity.model.rooms import AllRooms, Campus, Building, Room
+
+    campuses = {}
+    for c in range(3):
+        buildings = []
+        for b in range(20):
+            rooms = [Room(name=f"A{b}-{r}", room_id=f"{c}{b:02}{r:03}", room_id_encoded=f"encoded-{c}{b:02}{r:03}")
+                     for r in range(50)]
+            buildings.append(Building(name=f"教学楼{b}", rooms=rooms))
+        campuses[f"校区{c}"] = Campus(name=f"校区{c}", buildings=buildings)
+    return AllRooms(campuses=campuses)
+
+
+def make_multi_people_schedule():
+    """构造 30 人的多人日程，不发起 RPC"""
+    from everyclass.server.entity.model.multi_people_schedule import MultiPeopleSchedule, Event, People
+
+    schedule = MultiPeopleSchedule.__new__(MultiPeopleSchedule)
+    schedule.schedules = [{f"{i:02}{i + 1:02}": Event(name="软件工程基础", room="A座101") if i % 3 else None
+                           for i in range(1, 10, 2)}
+                          for _ in range(30)]
+    schedule.accessible_people = [People(name=f"学生{i}", id_encoded=f"encoded-{i}") for i in range(30)]
+    schedule.inaccessible_people = [People(name=f"学生{i}", id_encoded=f"encoded-{i}") for i in range(30, 35)]
+    return schedule
+
+
+def main():
+    from everyclass.server.utils import jsonable
+
+    payloads = {'AllRooms': {'status': 'success', 'data': make_all_rooms()},
+                'MultiPeopleSchedule': {'status': 'success', 'data': make_multi_people_schedule()}}
+
+    for name, payload in payloads.items():
+        number = 20 if name == 'AllRooms' else 2000
+        bench(f"{name} stdlib (to_json + encode)", lambda: jsonable.to_json(payload).encode('utf-8'), number=number)
+        if jsonable.orjson:
+            bench(f"{name} orjson (to_json_bytes)", lambda: jsonable.to_json_bytes(payload), number=number)
+        else:
+            print("orjson is not installed, skip orjson backend")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+"""
+对比学生课表页在运行时 htmlmin 压缩（HTML_MINIFY）和加载模板时压缩（TEMPLATE_MINIFY）两种方式下的每请求 CPU 耗时
+
+$ python -m tests.benchmarks.bench_minify
+"""
+from types import SimpleNamespace
+
+from tests.benchmarks import bench
+
+
+def make_student():
+    """构造一个每天 4 节课的学生课表，不发起 RPC"""
+    teacher = SimpleNamespace(name="杨柳", title="副教授", teacher_id_encoded="encoded-teacher")
+    cards = [SimpleNamespace(name=f"课程{day}{time}", teachers=[teacher], week_string="1-16/周", room="A座101",
+                             room_id_encoded="encoded-room", card_id_encoded=f"encoded-card-{day}{time}",
+                             lesson=f"{day}{time * 2 - 1:02}{time * 2:02}")
+             for day in range(1, 6) for time in range(1, 5)]
+    return SimpleNamespace(name="张三", deputy="计算机学院", klass="软件1601", student_id="3901160000",
+                           student_id_encoded="encoded-student", remark="", semesters=["2019-2020-1"], cards=cards)
+
+
+def render_student_page(app, student):
+    from collections import defaultdict
+    from flask import Markup, render_template
+    from everyclass.common.time import lesson_string_to_tuple
+    from everyclass.server.entity.views import _empty_column_check
+
+    cards = defaultdict(list)
+    for card in student.cards:
+        cards[lesson_string_to_tuple(card.lesson)].append(card)
+    empty_5, empty_6, empty_sat, empty_sun = _empty_column_check(cards)
+    timetable = render_template('entity/_timetable_student.html', cards=cards, empty_sat=empty_sat, empty_sun=empty_sun,
+                                empty_6=empty_6, empty_5=empty_5, current_semester="2019-2020-1")
+    html = render_template('entity/student.html', have_semesters=True, student=student, timetable=Markup(timetable),
+                           available_semesters=[("2019-2020-1", True)], current_semester="2019-2020-1")
+    response = app.response_class(html, mimetype='text/html')
+    return app.process_response(response)  # 执行 after_request 钩子（包括 response_minify）
+
+
+def make_app(template_minify: bool, html_minify: bool):
+    from everyclass.server import create_app
+    from everyclass.server.utils.config import override_config
+
+    with override_config(TEMPLATE_MINIFY=template_minify, HTML_MINIFY=html_minify):
+        return create_app()  # create_app 把配置复制到 app.config，退出后恢复原值不影响已创建的 app
+
+
+def main():
+    student = make_student()
+    for name, template_minify, html_minify in (("runtime htmlmin (before)", False, True),
+                                               ("template minify at load time (after)", True, False)):
+        app = make_app(template_minify, html_minify)
+        with app.test_request_context('/student/encoded-student/2019-2020-1'):
+            size = len(render_student_page(app, student).get_data())
+            bench(f"student page, {name}, {size} bytes", lambda: render_student_page(app, student), number=200)
+
+
+if __name__ == '__main__':
+    main()
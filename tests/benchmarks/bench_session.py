@@ -0,0 +1,49 @@
+"""
+对比加密 session 在 pickle 和 msgpack 两种序列化方式下的 open_session/save_session 耗时，以及未修改的 session 跳过加密的效果
+
+$ python -m tests.benchmarks.bench_session
+"""
+import uuid
+
+from flask import Flask
+
+from tests.benchmarks import bench
+
+CRYPTO_KEY = b'\xcb\xf2\x19H\xd9l\x05\xc7j\xb2\xd0^}B*\x8d\xb6\x8aPd\x1c%\x83\x1e_\xf0\xb9C\xa9XOC'
+
+
+def make_session_dict():
+    from everyclass.server.utils.session import UserSession
+
+    return {'user_id': 123,
+            'current_user': UserSession('student', '3901160000', 'encoded-student', '张三'),
+            'verification_req_id': uuid.uuid4(),
+            '_flashes': [('message', '登录成功')]}
+
+
+def main():
+    from everyclass.server.utils.session import EncryptedSessionInterface
+
+    app = Flask(__name__)
+    for serializer in ('pickle', 'msgpack'):
+        interface = EncryptedSessionInterface(CRYPTO_KEY, serializer)
+        cookie = interface.codec.encode(make_session_dict())
+        with app.test_request_context('/', headers={'Cookie': f'{interface.session_cookie_name}={cookie}'}) as ctx:
+            bench(f"open_session, {serializer}, {len(cookie)} bytes",
+                  lambda: interface.open_session(app, ctx.request))
+
+            def save_modified():
+                session = interface.open_session(app, ctx.request)
+                session['user_id'] = 456
+                interface.save_session(app, session, app.response_class())
+
+            def save_unmodified():
+                session = interface.open_session(app, ctx.request)
+                interface.save_session(app, session, app.response_class())
+
+            bench(f"open + save modified session, {serializer}", save_modified)
+            bench(f"open + save unmodified session, {serializer}", save_unmodified)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,291 @@
+"""
+用 goreplay 录制的线上流量回放压测
+
+生产环境的 goreplay 把 GET 请求录制在 /mnt/goreplay/*.log.gz（见 deploy/docker-cmd.sh）。本工具解析这些文件并回放：
+
+- 进程内模式（默认）：用 Flask test client 在当前进程中逐个请求，统计每个请求的 CPU 时间。entity、auth 上游被替换为读取
+  --fixtures 目录中录制结果的替身（--record 时缺失的结果会请求真实上游并保存）；安装了 fakeredis 时 Redis 被替换为内存实现。
+  Postgres 没有进程内替身，需要按 MODE 对应的配置连接本地数据库；
+- HTTP 模式（--target http://127.0.0.1:8080）：用 --concurrency 个线程向已启动的实例发送请求。指定 --target-pid 时按
+  /proc/<pid>/stat 统计这些进程在回放期间消耗的 CPU 时间。
+
+输出每个接口的请求数、错误数、p50/p95/p99 延迟、吞吐量和平均每请求 CPU 时间，--output 保存为 JSON，--compare 与之前保存的结果对比：
+
+$ python -m tests.benchmarks.replay /mnt/goreplay/host-2020-05-01.log.gz --fixtures /tmp/fixtures --record
+$ python -m tests.benchmarks.replay /mnt/goreplay/host-2020-05-01.log.gz --fixtures /tmp/fixtures --output after.json \\
+      --compare before.json
+"""
+import argparse
+import collections
+import gzip
+import hashlib
+import itertools
+import json
+import os
+import pickle
+import queue
+import re
+import subprocess
+import threading
+import time
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional
+
+PAYLOAD_SEPARATOR = "\n🐵🙈🙉\n"
+PAYLOAD_REQUEST = '1'
+_CHUNK_SIZE = 1 << 20  # 读取录制文件的块大小（字符数）
+
+# 转发给 Flask 时去掉的请求头，其余原样保留（包括 Cookie，以便回放登录用户的请求）
+_SKIPPED_HEADERS = {'host', 'content-length', 'connection', 'accept-encoding'}
+
+
+class Request(NamedTuple):
+    method: str
+    path: str
+    headers: Dict[str, str]
+
+
+def parse_capture(path: str) -> Iterator[Request]:
+    """解析 goreplay 的录制文件（可以是 gzip 压缩的），只返回请求"""
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rt', encoding='utf-8', errors='replace', newline='') as f:
+        yield from filter(None, map(_parse_payload, _iter_payloads(f)))
+
+
+def _iter_payloads(f) -> Iterator[str]:
+    """按块读取录制文件并按 PAYLOAD_SEPARATOR 切分，不把整个文件读入内存。分隔符可能跨越两个块，所以最后一段留到下一块再切分"""
+    buffer = ''
+    for chunk in iter(lambda: f.read(_CHUNK_SIZE), ''):
+        *payloads, buffer = (buffer + chunk).split(PAYLOAD_SEPARATOR)
+        yield from payloads
+    yield buffer
+
+
+def _parse_payload(payload: str) -> Optional[Request]:
+    meta, _, message = payload.lstrip('\n').partition('\n')
+    if not meta.startswith(PAYLOAD_REQUEST + ' '):
+        return None
+    head = message.split('\r\n\r\n', 1)[0]
+    request_line, *header_lines = head.split('\r\n')
+    parts = request_line.split(' ')
+    if len(parts) < 2:
+        return None
+    headers = {}
+    for line in header_lines:
+        name, _, value = line.partition(':')
+        if name.strip().lower() not in _SKIPPED_HEADERS:
+            headers[name.strip()] = value.strip()
+    return Request(parts[0], parts[1], headers)
+
+
+_ID_SEGMENT = re.compile(r'^(?=.*\d)[\w\-=]{6,}$|^[\w\-=]{20,}$')
+
+
+def endpoint_of(path: str) -> str:
+    """把路径中的资源 ID、学期等变化的部分替换为 :id，用于按接口聚合"""
+    segments = path.split('?', 1)[0].split('/')
+    return '/'.join(':id' if _ID_SEGMENT.match(segment) else segment for segment in segments)
+
+
+class FixtureUpstream:
+    """
+    entity、auth 上游的替身：按方法名和参数从 fixtures 目录读取录制的 RPC 结果。record 为 True 时，缺失的结果请求真实上游并保存
+    """
+
+    def __init__(self, directory: str, record: bool):
+        self.directory = directory
+        self.record = record
+        self.misses = 0
+
+    def patch(self, cls, method_names: List[str]) -> None:
+        for name in method_names:
+            setattr(cls, name, self._make_stub(cls.__name__, name, getattr(cls, name)))
+
+    def _make_stub(self, cls_name: str, name: str, original):
+        def stub(*args, **kwargs):
+            digest = hashlib.sha1(repr((args, sorted(kwargs.items()))).encode()).hexdigest()
+            path = os.path.join(self.directory, cls_name, name, f"{digest}.pickle")
+            if os.path.exists(path):
+                with open(path, 'rb') as f:
+                    return pickle.load(f)
+            if not self.record:
+                self.misses += 1
+                raise LookupError(f"no fixture for {cls_name}.{name}{args}")
+            result = original(*args, **kwargs)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as f:
+                pickle.dump(result, f)
+            return result
+
+        return staticmethod(stub)
+
+
+def install_stand_ins(fixtures: str, record: bool) -> FixtureUpstream:
+    """在创建 app 之前替换上游和 Redis"""
+    upstream = FixtureUpstream(fixtures, record)
+    from everyclass.rpc.auth import Auth
+    from everyclass.rpc.entity import Entity
+
+    upstream.patch(Entity, ['search', 'get_student', 'get_student_timetable', 'get_teacher', 'get_teacher_timetable',
+                            'get_classroom_timetable', 'get_card', 'get_rooms', 'get_available_rooms'])
+    upstream.patch(Auth, ['register_by_email', 'verify_email_token', 'register_by_password', 'get_result'])
+
+    try:
+        import fakeredis
+    except ImportError:
+        print("fakeredis is not installed, using the configured Redis")
+    else:
+        import redis
+        from everyclass.server.utils.db.redis import redis as client
+
+        # 其他模块已经引用了同一个 client 对象，替换它的连接池而不是 client 本身
+        client.connection_pool = redis.ConnectionPool(connection_class=fakeredis.FakeConnection, server=fakeredis.FakeServer())
+    return upstream
+
+
+def replay_in_process(requests: Iterable[Request], args) -> Dict[str, List]:
+    upstream = install_stand_ins(args.fixtures, args.record)
+    from everyclass.server import create_app
+
+    app = create_app()
+    app.config['DATA_LAST_UPDATE_TIME'] = args.data_version
+    client = app.test_client()
+
+    samples = collections.defaultdict(list)
+    for request in requests:
+        wall, cpu = time.perf_counter(), time.process_time()
+        response = client.open(request.path, method=request.method, headers=request.headers)
+        samples[endpoint_of(request.path)].append((time.perf_counter() - wall, time.process_time() - cpu,
+                                                   response.status_code >= 500))
+    if upstream.misses:
+        print(f"{upstream.misses} upstream calls had no fixture, run with --record first")
+    return samples
+
+
+def _process_cpu_seconds(pids: List[int]) -> float:
+    total = 0
+    for pid in pids:
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(')', 1)[1].split()
+        total += int(fields[11]) + int(fields[12])  # utime、stime
+    return total / os.sysconf('SC_CLK_TCK')
+
+
+def replay_over_http(requests: Iterable[Request], args) -> Dict[str, List]:
+    import requests as http
+
+    tasks = queue.Queue(maxsize=args.concurrency * 2)  # 边解析边回放，不在内存中保存全部请求
+    samples = collections.defaultdict(list)
+    lock = threading.Lock()
+
+    def worker():
+        session = http.Session()
+        while True:
+            request = tasks.get()
+            if request is None:
+                return
+            start = time.perf_counter()
+            try:
+                error = session.request(request.method, args.target + request.path, headers=request.headers,
+                                        allow_redirects=False, timeout=30).status_code >= 500
+            except http.RequestException:
+                error = True
+            with lock:
+                samples[endpoint_of(request.path)].append((time.perf_counter() - start, None, error))
+
+    cpu_before = _process_cpu_seconds(args.target_pid) if args.target_pid else None
+    threads = [threading.Thread(target=worker) for _ in range(args.concurrency)]
+    for thread in threads:
+        thread.start()
+    for request in requests:
+        tasks.put(request)
+    for _ in threads:
+        tasks.put(None)
+    for thread in threads:
+        thread.join()
+    if args.target_pid:
+        # 目标进程的 CPU 时间无法归属到单个请求，按请求数平均
+        total = sum(len(endpoint_samples) for endpoint_samples in samples.values())
+        cpu_per_request = (_process_cpu_seconds(args.target_pid) - cpu_before) / total
+        for endpoint in samples:
+            samples[endpoint] = [(latency, cpu_per_request, error) for latency, _, error in samples[endpoint]]
+    return samples
+
+
+def _percentile(sorted_values: List[float], percentile: int) -> float:
+    return sorted_values[min(len(sorted_values) - 1, len(sorted_values) * percentile // 100)]
+
+
+def summarize(samples: Dict[str, List], duration: float) -> Dict:
+    endpoints = {}
+    for endpoint, values in sorted(samples.items()):
+        latencies = sorted(latency for latency, _, _ in values)
+        cpu = [cpu for _, cpu, _ in values if cpu is not None]
+        endpoints[endpoint] = {'count': len(values),
+                               'errors': sum(1 for _, _, error in values if error),
+                               'p50_ms': _percentile(latencies, 50) * 1000,
+                               'p95_ms': _percentile(latencies, 95) * 1000,
+                               'p99_ms': _percentile(latencies, 99) * 1000,
+                               'cpu_ms': sum(cpu) / len(cpu) * 1000 if cpu else None}
+    total = sum(len(values) for values in samples.values())
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {'commit': commit, 'requests': total, 'duration_s': duration, 'throughput_rps': total / duration,
+            'endpoints': endpoints}
+
+
+def print_report(result: Dict, baseline: Optional[Dict]) -> None:
+    print(f"{result['requests']} requests in {result['duration_s']:.1f}s, {result['throughput_rps']:.1f} req/s"
+          f" (commit {result['commit']})")
+    print(f"{'endpoint':<50} {'count':>7} {'errors':>7} {'p50':>9} {'p95':>9} {'p99':>9} {'cpu':>9}")
+    for endpoint, stats in result['endpoints'].items():
+        line = f"{endpoint[:50]:<50} {stats['count']:>7} {stats['errors']:>7}"
+        for key in ('p50_ms', 'p95_ms', 'p99_ms', 'cpu_ms'):
+            line += f" {stats[key]:>9.2f}" if stats[key] is not None else f" {'-':>9}"
+        before = baseline['endpoints'].get(endpoint) if baseline else None
+        if before:
+            line += f"   p95 {(stats['p95_ms'] - before['p95_ms']) / before['p95_ms'] * 100:+.1f}%"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('captures', nargs='+', help="goreplay 录制文件")
+    parser.add_argument('--target', help="HTTP 模式下请求的实例地址，如 http://127.0.0.1:8080。不指定时在进程内回放")
+    parser.add_argument('--target-pid', type=lambda s: [int(pid) for pid in s.split(',')], help="HTTP 模式下统计 CPU 的进程号")
+    parser.add_argument('--concurrency', type=int, default=4, help="HTTP 模式的并发数")
+    parser.add_argument('--fixtures', default='tests/benchmarks/fixtures', help="进程内模式下上游录制结果的目录")
+    parser.add_argument('--record', action='store_true', help="缺失的上游结果请求真实上游并保存")
+    parser.add_argument('--data-version', default='replay', help="进程内模式使用的数据版本")
+    parser.add_argument('--limit', type=int, help="最多回放的请求数")
+    parser.add_argument('--output', help="把结果保存为 JSON")
+    parser.add_argument('--compare', help="与之前保存的 JSON 结果对比")
+    args = parser.parse_args()
+
+    # 录制文件可能很大，请求边解析边回放，达到 --limit 后不再继续解析
+    requests = itertools.islice(itertools.chain.from_iterable(parse_capture(capture) for capture in args.captures),
+                                args.limit)
+    first = next(requests, None)
+    if first is None:
+        print("No request found in the captures")
+        return
+    requests = itertools.chain([first], requests)
+    print("Replaying requests" + (f" (at most {args.limit})" if args.limit else ""))
+
+    start = time.perf_counter()
+    samples = replay_over_http(requests, args) if args.target else replay_in_process(requests, args)
+    result = summarize(samples, time.perf_counter() - start)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_report(result, baseline)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -37,3 +37,41 @@ class BasicFunctionTestCase(unittest.TestCase):
     def test_tuple_semester(self):
         from everyclass.server.entity.model import Semester
         self.assertTrue(Semester('2016-2017-2').to_tuple() == (2016, 2017, 2))
+
+
+class ImportTimeTestCase(unittest.TestCase):
+    """用 python -X importtime 检查配置模块的导入开销，防止 worker 启动变慢"""
+
+    # 配置模块（含依赖）的累计导入耗时不超过同一次运行中导入 inspect 和 json（配置模块依赖的标准库）耗时的多少倍。用比例而不是固定
+    # 的时间，在较慢的 CI 机器上也不会误报，导入 git 之类的重型依赖时仍然会失败
+    config_import_ratio = 20
+    repeat = 3  # 取多次运行中的最小值，排除冷启动时读取文件的开销
+
+    @staticmethod
+    def import_times(module: str) -> dict:
+        """在子进程中导入 module，返回每个被导入模块的累计导入耗时（微秒）"""
+        import os
+        import subprocess
+        import sys
+
+        result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                                stderr=subprocess.PIPE, universal_newlines=True, check=True,
+                                cwd=os.path.join(os.path.dirname(__file__), ".."))
+        times = {}
+        for line in result.stderr.splitlines():
+            if not line.startswith("import time:") or "cumulative" in line:
+                continue
+            _, cumulative, name = line[len("import time:"):].split("|")
+            times[name.strip()] = int(cumulative)
+        return times
+
+    def test_config_import_time(self):
+        times = self.import_times("everyclass.server.utils.config")
+        self.assertNotIn("git", times)  # git 信息在第一次读取时才加载
+
+        config = min(self.import_times("everyclass.server.utils.config")["everyclass.server.utils.config"]
+                     for _ in range(self.repeat))
+        # 解释器启动时已经导入的模块不会出现在结果中，配置模块的耗时中也不包含它们
+        baseline = min(sum(self.import_times("inspect, json").get(name, 0) for name in ("inspect", "json"))
+                       for _ in range(self.repeat))
+        self.assertLess(config, baseline * self.config_import_ratio)
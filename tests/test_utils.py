@@ -70,3 +70,606 @@ class ResourceIdentifierEncryptTest(unittest.TestCase):
         from everyclass.server.utils.encryption import decrypt
         for tp, data, encrypted in self.cases:
             self.assertTrue(decrypt(encrypted, encryption_key=self.key, resource_type=tp) == (tp, data))
+
+
+class JSONSerializationTest(unittest.TestCase):
+    """everyclass/server/utils/jsonable.py"""
+
+    def test_to_json_bytes_same_as_to_json(self):
+        import json
+        from everyclass.server.entity.model.rooms import Room, Building
+        from everyclass.server.utils.jsonable import to_json, to_json_bytes
+
+        obj = {'status': 'success',
+               'data': Building(name="A座", rooms=[Room(name="A101", room_id="raw-id", room_id_encoded="encoded-id")])}
+        self.assertEqual(json.loads(to_json_bytes(obj)), json.loads(to_json(obj)))
+        self.assertNotIn(b"raw-id", to_json_bytes(obj))  # 不应输出 __json_encode__ 未包含的字段
+
+    def test_named_tuple(self):
+        import json
+        from typing import NamedTuple
+        from everyclass.server.utils.jsonable import to_json, to_json_bytes
+
+        class Point(NamedTuple):
+            x: int
+            y: int
+
+        obj = {'points': [Point(1, 2), (3, 4)]}
+        self.assertEqual(json.loads(to_json_bytes(obj)), {'points': [[1, 2], [3, 4]]})
+        self.assertEqual(json.loads(to_json_bytes(obj)), json.loads(to_json(obj)))
+
+
+class TemplateMinifyTest(unittest.TestCase):
+    """everyclass/server/utils/template_minify.py"""
+
+    def test_minify_template_source(self):
+        from everyclass.server.utils.template_minify import minify_template_source
+        source = "<div>\n    <b>{{ name }}</b>\n\n    <a>x</a>\n</div>\n"
+        self.assertEqual(minify_template_source(source), "<div>\n<b>{{ name }}</b>\n<a>x</a>\n</div>\n")
+
+    def test_preserve_textarea(self):
+        from everyclass.server.utils.template_minify import minify_template_source
+        source = "<form>\n    <textarea>\n  keep\n    this</textarea>\n</form>"
+        self.assertEqual(minify_template_source(source), "<form>\n<textarea>\n  keep\n    this</textarea>\n</form>")
+
+
+class SessionCodecTest(unittest.TestCase):
+    """everyclass/server/utils/session.py"""
+
+    key = b'\xcb\xf2\x19H\xd9l\x05\xc7j\xb2\xd0^}B*\x8d\xb6\x8aPd\x1c%\x83\x1e_\xf0\xb9C\xa9XOC'
+
+    def test_round_trip(self):
+        import uuid
+        from everyclass.server.utils.session import SessionCodec, UserSession
+
+        session = {'user_id': 123, 'current_user': UserSession('student', '3901160000', 'encoded', '张三'),
+                   'verification_req_id': uuid.uuid4()}
+        for serializer in ('msgpack', 'pickle'):
+            codec = SessionCodec(self.key, serializer)
+            self.assertEqual(codec.decode(codec.encode(session)), session)
+
+    def test_read_legacy_cookie(self):
+        import base64
+        import pickle
+        from Crypto.Cipher import AES
+        from everyclass.server.utils.session import SessionCodec
+
+        session = {'user_id': 123}
+        cipher = AES.new(self.key, AES.MODE_EAX)
+        ciphertext, mac = cipher.encrypt_and_digest(pickle.dumps(session))
+        cookie = ".".join(["u"] + [base64.b64encode(part).decode() for part in (ciphertext, mac, cipher.nonce)])
+        self.assertEqual(SessionCodec(self.key).decode(cookie), session)
+        self.assertIsNone(SessionCodec(self.key).decode("2m.invalid"))
+
+    def test_server_side_session(self):
+        from flask import Flask, session
+        from everyclass.server.utils.session import LocalSessionStore, ServerSideSessionInterface, UserSession
+
+        app = Flask(__name__)
+        store = LocalSessionStore()
+        app.session_interface = ServerSideSessionInterface(store, 'secret')
+
+        @app.route('/set')
+        def set_value():
+            session['user_id'] = 123
+            return ''
+
+        @app.route('/get')
+        def get_value():
+            return str(session.get('user_id'))
+
+        @app.route('/login')
+        def login():
+            session['current_user'] = UserSession('student', '3901160000', 'encoded', '张三')
+            return ''
+
+        client = app.test_client()
+        self.assertNotIn('Set-Cookie', client.get('/get').headers)  # empty session is not persisted
+        self.assertIn('Set-Cookie', client.get('/set').headers)
+        response = client.get('/get')
+        self.assertEqual(response.get_data(as_text=True), '123')
+        self.assertNotIn('Set-Cookie', response.headers)  # unmodified session is not written again
+        self.assertEqual(len(store._data), 1)
+
+        # a modified session is written with a new TTL, the cookie is sent again with it
+        sid = next(iter(store._data))
+        self.assertIn('Set-Cookie', client.get('/set').headers)
+        self.assertEqual(list(store._data), [sid])
+
+        # logging in issues a new session id and drops the old one
+        self.assertIn('Set-Cookie', client.get('/login').headers)
+        self.assertEqual(len(store._data), 1)
+        self.assertNotIn(sid, store._data)
+        self.assertEqual(client.get('/get').get_data(as_text=True), '123')
+
+
+class MaintenanceTest(unittest.TestCase):
+    """everyclass/server/utils/maintenance.py"""
+
+    def test_switch(self):
+        import os
+        import tempfile
+        from everyclass.server.utils import maintenance
+        from everyclass.server.utils.config import override_config
+
+        with tempfile.TemporaryDirectory() as directory, \
+                override_config(MAINTENANCE_FILE=os.path.join(directory, 'maintenance')):
+            maintenance.switch(True)
+            self.assertTrue(maintenance.enabled)
+            maintenance.switch(False)
+            self.assertFalse(maintenance.enabled)
+            with self.assertRaises(FileNotFoundError):
+                maintenance.switch(False)
+
+
+class PreparedStatementTest(unittest.TestCase):
+    """everyclass/server/utils/db/prepared.py"""
+
+    def test_placeholders(self):
+        from everyclass.server.utils.db.prepared import PreparedStatement
+
+        statement = PreparedStatement("test_insert", "INSERT INTO t (a, b) VALUES (%s, %s)")
+        self.assertEqual(statement._prepare_query, "PREPARE test_insert AS INSERT INTO t (a, b) VALUES ($1, $2)")
+        self.assertEqual(statement._execute_query, "EXECUTE test_insert (%s,%s)")
+        with self.assertRaises(ValueError):
+            PreparedStatement("test_insert", "SELECT 1")
+
+
+class SingleFlightTest(unittest.TestCase):
+    """everyclass/server/utils/single_flight.py"""
+
+    def test_concurrent_calls_share_result(self):
+        import threading
+        import time
+        from everyclass.server.utils.single_flight import single_flight
+
+        calls = []
+
+        @single_flight
+        def fetch(identifier):
+            calls.append(identifier)
+            time.sleep(0.1)
+            return identifier.upper()
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(fetch('abc'))) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(calls, ['abc'])
+        self.assertEqual(results, ['ABC'] * 5)
+        self.assertEqual(fetch('abc'), 'ABC')  # 完成后的调用重新执行
+        self.assertEqual(len(calls), 2)
+
+    def test_leader_interrupted(self):
+        import threading
+        import time
+        from everyclass.server.utils.single_flight import single_flight
+
+        class Interrupted(BaseException):
+            pass
+
+        started, finish = threading.Event(), threading.Event()
+        calls = []
+
+        @single_flight
+        def fetch(identifier):
+            calls.append(identifier)
+            if len(calls) == 1:
+                started.set()
+                finish.wait()
+                raise Interrupted()
+            return identifier.upper()
+
+        results = []
+
+        def call():
+            try:
+                results.append(fetch('abc'))
+            except Interrupted as e:
+                results.append(e)
+
+        leader = threading.Thread(target=call)
+        leader.start()
+        started.wait()
+        follower = threading.Thread(target=call)
+        follower.start()
+        time.sleep(0.05)
+        finish.set()
+        leader.join()
+        follower.join()
+        # 领头的调用被 BaseException 中断时，异常只在它自己的线程中抛出，等待的调用自己重新发起调用
+        self.assertIsInstance(results[0], Interrupted)
+        self.assertEqual(results[1:], ['ABC'])
+        self.assertEqual(calls, ['abc', 'abc'])
+
+
+class CircuitBreakerTest(unittest.TestCase):
+    """everyclass/server/utils/circuit_breaker.py"""
+
+    def test_open_and_recover(self):
+        import time
+        from everyclass.server.utils.circuit_breaker import CircuitBreaker, UpstreamUnavailable, STATE_CLOSED, STATE_OPEN
+        from everyclass.server.utils.config import override_config
+
+        def failing():
+            raise UpstreamUnavailable('test', 'timeout')
+
+        with override_config(CIRCUIT_BREAKER_FAILURE_THRESHOLD=2, CIRCUIT_BREAKER_RESET_TIMEOUT=0.1):
+            breaker = CircuitBreaker('test')
+            for _ in range(2):
+                with self.assertRaises(UpstreamUnavailable):
+                    breaker.call(failing)
+            self.assertEqual(breaker.state, STATE_OPEN)
+
+            # 熔断期间不会调用上游
+            with self.assertRaises(UpstreamUnavailable) as cm:
+                breaker.call(lambda: self.fail("should not be called"))
+            self.assertEqual(cm.exception.reason, 'open')
+
+            # 半开状态下试探调用成功后恢复
+            time.sleep(0.1)
+            self.assertEqual(breaker.call(lambda: 'ok'), 'ok')
+            self.assertEqual(breaker.state, STATE_CLOSED)
+
+    def test_bulkhead(self):
+        import threading
+        from everyclass.server.utils.circuit_breaker import CircuitBreaker, UpstreamUnavailable
+        from everyclass.server.utils.config import override_config
+
+        with override_config(CIRCUIT_BREAKER_MAX_CONCURRENCY=1, CIRCUIT_BREAKER_BULKHEAD_WAIT=1):
+            breaker = CircuitBreaker('test')
+            started, finish = threading.Event(), threading.Event()
+
+            def slow():
+                started.set()
+                finish.wait()
+
+            thread = threading.Thread(target=breaker.call, args=(slow,))
+            thread.start()
+            started.wait()
+            # 上游正常时等待空闲名额
+            threading.Timer(0.05, finish.set).start()
+            self.assertEqual(breaker.call(lambda: 'ok'), 'ok')
+            thread.join()
+
+            # 上游出现失败后名额已满时直接拒绝
+            started.clear()
+            finish.clear()
+            breaker.failures = 1
+            thread = threading.Thread(target=breaker.call, args=(slow,))
+            thread.start()
+            started.wait()
+            with self.assertRaises(UpstreamUnavailable) as cm:
+                breaker.call(lambda: 'ok')
+            self.assertEqual(cm.exception.reason, 'bulkhead')
+            finish.set()
+            thread.join()
+
+    def test_interrupted_trial(self):
+        import time
+        from everyclass.server.utils.circuit_breaker import CircuitBreaker, STATE_HALF_OPEN, STATE_OPEN
+
+        class Interrupted(BaseException):
+            pass
+
+        def interrupted():
+            raise Interrupted()
+
+        breaker = CircuitBreaker('test')
+        breaker.state = STATE_OPEN
+        breaker.opened_at = time.monotonic() - 3600
+        with self.assertRaises(Interrupted):
+            breaker.call(interrupted)
+        self.assertEqual(breaker.state, STATE_HALF_OPEN)
+        self.assertEqual(breaker.call(lambda: 'ok'), 'ok')  # 被中断的试探调用不会让熔断器一直停在半开状态
+
+
+class AutocompleteIndexTest(unittest.TestCase):
+    """everyclass/server/entity/repo/autocomplete_index.py"""
+
+    def test_prefix_search(self):
+        import os
+        import tempfile
+        from everyclass.server.entity.repo import autocomplete_index
+
+        records = [{'id': '3901160407', 'name': '张三'},
+                   {'id': '3901160408', 'name': '张三丰'},
+                   {'id': '0201130', 'name': 'Li Si'}]
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'autocomplete.idx')
+            self.assertEqual(autocomplete_index.build(path, 'v1', records), 3)
+
+            index = autocomplete_index.AutocompleteIndex(path)
+            self.assertEqual(index.data_version, 'v1')
+            self.assertFalse(index.complete)
+            self.assertEqual([r['id'] for r in index.search('张三', 10)], ['3901160407', '3901160408'])
+            self.assertEqual([r['id'] for r in index.search('39011604', 1)], ['3901160407'])
+            self.assertEqual([r['name'] for r in index.search('li', 10)], ['Li Si'])
+            self.assertEqual(index.search('王', 10), [])
+            if autocomplete_index.lazy_pinyin:
+                self.assertEqual(len(index.search('zs', 10)), 2)
+
+            self.assertFalse(index.is_stale(path))
+            autocomplete_index.build(path, 'v2', records[:1], complete=True)
+            self.assertTrue(index.is_stale(path))
+            self.assertTrue(autocomplete_index.AutocompleteIndex(path).complete)
+
+
+class MemoryRedis:
+    """缓存模块用到的 Redis 命令的内存实现，不支持过期"""
+
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, value, ex=None, nx=False):
+        if nx and key in self.data:
+            return None
+        self.data[key] = value if isinstance(value, bytes) else str(value).encode()  # 和 Redis 一样返回 bytes
+        return True
+
+    def hset(self, key, mapping):
+        self.data.setdefault(key, {}).update(mapping)
+
+    def hmget(self, key, fields):
+        return [self.data.get(key, {}).get(field) for field in fields]
+
+    def expire(self, key, seconds):
+        pass
+
+    def delete(self, *keys):
+        for key in keys:
+            self.data.pop(key, None)
+
+    def pipeline(self, transaction=True):
+        return self
+
+    def execute(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        return False
+
+
+class ServeStaleTest(unittest.TestCase):
+    """everyclass/server/entity/domain.py"""
+
+    def setUp(self):
+        from unittest import mock
+        from flask import Flask, current_app
+        from everyclass.server.entity import domain
+        from everyclass.server.entity.repo import entity_cache
+        from everyclass.server.utils.circuit_breaker import UpstreamUnavailable
+
+        thread_class = domain.threading.Thread
+
+        class JoinedThread:
+            """启动后台线程后等待它结束，使后台刷新在测试中同步完成。刷新在没有 Flask 上下文的新线程中执行"""
+
+            def __init__(self, target, daemon=None):
+                self.thread = thread_class(target=target, daemon=daemon)
+
+            def start(self):
+                self.thread.start()
+                self.thread.join()
+
+        self.calls = []
+        self.failing = False
+
+        @domain.serve_stale
+        def fetch(identifier):
+            self.calls.append(identifier)
+            if self.failing:
+                raise UpstreamUnavailable('entity', 'open')
+            # 后台刷新时也需要 app 上下文
+            return f"{identifier}@{current_app.config['DATA_LAST_UPDATE_TIME']}#{len(self.calls)}"
+
+        self.fetch = fetch
+        self.app = Flask(__name__)
+        self.app.config['DATA_LAST_UPDATE_TIME'] = 'v1'
+        for patcher in (mock.patch.object(entity_cache, 'redis', MemoryRedis()),
+                        mock.patch.object(domain.threading, 'Thread', JoinedThread)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_fresh(self):
+        from everyclass.server.utils.config import override_config
+
+        with self.app.test_request_context(), override_config(ENTITY_CACHE_SOFT_TTL=60, ENTITY_CACHE_HARD_TTL=120):
+            self.assertEqual(self.fetch('3901160407'), '3901160407@v1#1')
+            self.assertEqual(self.fetch('3901160407'), '3901160407@v1#1')
+            self.assertEqual(self.fetch(identifier='3901160407'), '3901160407@v1#2')  # 关键字参数使用另一个缓存
+
+    def test_soft_expired(self):
+        from everyclass.server.utils.config import override_config
+
+        with self.app.test_request_context():
+            with override_config(ENTITY_CACHE_SOFT_TTL=0, ENTITY_CACHE_HARD_TTL=120):
+                self.assertEqual(self.fetch('3901160407'), '3901160407@v1#1')
+                self.assertEqual(self.fetch('3901160407'), '3901160407@v1#1')  # 返回缓存，同时在后台刷新
+                self.assertEqual(self.fetch('3901160407'), '3901160407@v1#2')
+                self.assertEqual(len(self.calls), 2)  # 刷新的锁在超时前不会被再次获得
+            with override_config(ENTITY_CACHE_SOFT_TTL=60, ENTITY_CACHE_HARD_TTL=120):
+                self.assertEqual(self.fetch('3901160407'), '3901160407@v1#2')
+
+            with override_config(ENTITY_CACHE_SOFT_TTL=0, ENTITY_CACHE_HARD_TTL=120):
+                self.fetch('3901160408')
+                self.failing = True
+                self.assertEqual(self.fetch('3901160408'), '3901160408@v1#3')  # 后台刷新失败时缓存保持不变
+            with override_config(ENTITY_CACHE_SOFT_TTL=60, ENTITY_CACHE_HARD_TTL=120):
+                self.assertEqual(self.fetch('3901160408'), '3901160408@v1#3')
+
+    def test_hard_expired_and_stale_if_error(self):
+        from flask import g
+        from everyclass.server.utils.circuit_breaker import UpstreamUnavailable
+        from everyclass.server.utils.config import override_config
+
+        with override_config(ENTITY_CACHE_SOFT_TTL=0, ENTITY_CACHE_HARD_TTL=0):
+            with self.app.test_request_context():
+                self.assertEqual(self.fetch('3901160407'), '3901160407@v1#1')
+                self.assertEqual(self.fetch('3901160407'), '3901160407@v1#2')  # 超过硬过期时间后同步请求上游
+
+            self.app.config['DATA_LAST_UPDATE_TIME'] = 'v2'
+            self.failing = True
+            with self.app.test_request_context():
+                self.assertEqual(self.fetch('3901160407'), '3901160407@v1#2')  # 上游不可用时返回之前数据版本的结果
+                self.assertTrue(g.entity_data_stale)
+                with self.assertRaises(UpstreamUnavailable):
+                    self.fetch('3901160408')
+
+
+class SearchCacheTest(unittest.TestCase):
+    """everyclass/server/entity/repo/search_cache.py"""
+
+    def setUp(self):
+        from types import SimpleNamespace
+        from unittest import mock
+        from flask import Flask
+        from everyclass.server.entity import service
+        from everyclass.server.entity.repo import search_cache
+
+        self.searched = []
+
+        def search(keyword):
+            self.searched.append(keyword)
+            if keyword == '0000':
+                return SimpleNamespace(students=[], teachers=[], classrooms=[])
+            return SimpleNamespace(students=[SimpleNamespace(student_id='3901160407', name='张三')],
+                                   teachers=[SimpleNamespace(teacher_id='0101', name='李四')], classrooms=[])
+
+        app = Flask(__name__)
+        app.config['DATA_LAST_UPDATE_TIME'] = 'v1'
+        context = app.app_context()
+        context.push()
+        self.addCleanup(context.pop)
+        for patcher in (mock.patch.object(search_cache, 'redis', MemoryRedis()),
+                        mock.patch.object(service.Entity, 'search', search)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_search(self):
+        from everyclass.server.entity import service
+
+        self.assertEqual(service.search('3901160407').students[0].name, '张三')
+        self.assertEqual(service.search(' ３９０１１６０４０７ ').students[0].name, '张三')  # 规范化后命中缓存
+        self.assertEqual(self.searched, ['3901160407'])
+
+    def test_get_people_info_batch(self):
+        from everyclass.server.entity import service
+
+        service.search('3901160407')
+        people = service.get_people_info_batch(['3901160407', '0101', '3901160407'])
+        self.assertEqual({identifier: info.name for identifier, info in people.items()},
+                         {'3901160407': '张三', '0101': '李四'})
+        self.assertEqual(self.searched, ['3901160407'])  # 两个人都从学号/教工号索引中读取
+
+        self.assertEqual(service.get_people_info_batch(['0000']), {})
+        self.assertEqual(self.searched, ['3901160407', '0000'])
+
+
+class TeachersDisplaySyncTest(unittest.TestCase):
+    """everyclass/server/course/service.py"""
+
+    def test_version_recorded_after_success(self):
+        from unittest import mock
+        from everyclass.server.course import service
+
+        redis = MemoryRedis()
+        with mock.patch.object(service, 'redis', redis), mock.patch.object(service, 'db_session'), \
+                mock.patch.object(service.KlassMeta, 'sync_teachers_display', side_effect=[RuntimeError, None]) as sync:
+            with self.assertRaises(RuntimeError):
+                service.sync_teachers_display('v1')
+            self.assertFalse(service.teachers_display_synced('v1'))  # 失败时不记录版本，下次检查时重试
+            self.assertIsNone(redis.get(service._TEACHERS_DISPLAY_LOCK_KEY))
+
+            service.sync_teachers_display('v1')
+            self.assertTrue(service.teachers_display_synced('v1'))
+            self.assertFalse(service.teachers_display_synced('v2'))
+            service.sync_teachers_display('v1')  # 已经同步过的版本不会再次同步
+            self.assertEqual(sync.call_count, 2)
+
+
+class CardTest(unittest.TestCase):
+    """everyclass/server/entity/model/card.py"""
+
+    def test_weeks(self):
+        from everyclass.server.entity.model.card import Card
+
+        card = Card('高等数学', '39048', [], 'A101', 'room', 'card', '1-3, 16', '10102', [16, 1, 2, 3])
+        self.assertEqual((card.day, card.session), (1, 1))
+        self.assertEqual(card.weeks, [1, 2, 3, 16])
+        self.assertTrue(card.in_week(16))
+        self.assertFalse(card.in_week(4))
+        self.assertFalse(card.in_week(0))
+        self.assertEqual(Card('体育', '1', [], '', '', '', '', '10102', []).weeks, [])
+
+    def test_pickle(self):
+        import pickle
+        from everyclass.server.entity.model.card import Card
+
+        card = Card('高等数学', '39048', ['张三'], 'A101', 'room', 'card', '1-3, 16', '30506', [1, 2, 3, 16])
+        loaded = pickle.loads(pickle.dumps(card, protocol=pickle.HIGHEST_PROTOCOL))
+        self.assertEqual(card.__getstate__(), loaded.__getstate__())
+        self.assertEqual(loaded.weeks, [1, 2, 3, 16])
+        self.assertEqual((loaded.day, loaded.lesson, loaded.teachers), (3, '30506', ['张三']))
+
+
+class TimetableSnapshotTest(unittest.TestCase):
+    """everyclass/server/entity/repo/timetable_snapshot.py"""
+
+    def test_build_and_get(self):
+        import os
+        import tempfile
+        from everyclass.server.entity.repo import timetable_snapshot
+
+        entries = [('student:3901160407', {'name': '张三', 'cards': [1, 2]}),
+                   ('room:0120101', {'name': 'A101', 'cards': []}),
+                   ('card:12345', {'name': '高等数学'})]
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'timetable.snapshot')
+            self.assertEqual(timetable_snapshot.build(path, 'v1', '2019-2020-2', entries), 3)
+
+            snapshot = timetable_snapshot.TimetableSnapshot(path)
+            self.assertEqual((snapshot.data_version, snapshot.semester), ('v1', '2019-2020-2'))
+            for key, value in entries:
+                self.assertEqual(snapshot.get(key), value)
+            self.assertIsNone(snapshot.get('student:3901160408'))
+            self.assertIsNone(snapshot.get('card:1234'))
+
+
+class TimingTest(unittest.TestCase):
+    """everyclass/server/utils/timing.py"""
+
+    def test_phases(self):
+        from flask import Flask
+        from everyclass.server.utils import timing
+
+        app = Flask(__name__)
+        enabled, timing.enabled = timing.enabled, True
+        try:
+            with timing.phase(timing.PHASE_RPC):  # 不在请求上下文中时不记录
+                pass
+            with app.test_request_context():
+                with timing.phase(timing.PHASE_RPC):
+                    pass
+                timing.record(timing.PHASE_RPC, 0.5)
+                timing.record(timing.PHASE_DB, 0.25)
+                self.assertGreaterEqual(timing.get_timings()[timing.PHASE_RPC], 0.5)
+                header = timing.server_timing_header(1)
+                self.assertTrue(header.startswith('rpc;dur=50'))
+                self.assertTrue(header.endswith('db;dur=250.00, total;dur=1000.00'))
+
+            timing.enabled = False
+            with app.test_request_context():
+                with timing.phase(timing.PHASE_RPC):
+                    pass
+                self.assertEqual(timing.get_timings(), {})
+        finally:
+            timing.enabled = enabled